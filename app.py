@@ -1,8 +1,16 @@
 from db_manager import DBManager
-from datetime import datetime
+from booking_queue import describe_outcome, wait_for_outcome
+from scheduler import ClassRequest, generate_timetable
+from datetime import datetime, timedelta
+import argparse
 import sys
 import os
 
+# Number of classes shown per page on the member booking screen
+CLASS_PAGE_SIZE = 10
+MEMBER_PAGE_SIZE = 10
+TREND_WEEKS = 8
+
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -124,11 +132,18 @@ def member_view_dashboard(db, id):
     if profile:
         health_metrics = profile[6]
         total_bookings = profile[7] if len(profile) > 7 else 0
+        metric_count = profile[8] if len(profile) > 8 else 0
         print(f"Name: {profile[1]} {profile[2]}")
         print(f"Fitness Goals: {profile[5]}")
         print(f"Total Bookings: {total_bookings}")
+        print(f"Health Metric Entries: {metric_count}")
         if health_metrics:
             print(f"Recent Health Metrics: Weight - {health_metrics.weight}lbs, Height - {health_metrics.height}cm, Body Fat - {health_metrics.bodyfat}%")
+        series = db.get_metric_series(id, "week", datetime.utcnow() - timedelta(weeks=TREND_WEEKS))
+        if series and not isinstance(series, str):
+            print(f"=== Weekly Trend (last {TREND_WEEKS} weeks) ===")
+            for period, samples, weight_avg, weight_min, weight_max, height_avg, bodyfat_avg, bodyfat_min, bodyfat_max in series:
+                print(f"Week of {period:%Y-%m-%d}: Weight {weight_avg}lbs ({weight_min}-{weight_max}), Body Fat {bodyfat_avg}% ({bodyfat_min}-{bodyfat_max}), Entries: {samples}")
     else:
         print("Profile not found.")
 
@@ -142,14 +157,14 @@ def member_manage_booking(db, id):
         if bookings:
             print("=== Your Bookings ===")
             for b in bookings:
-                print(f"Booking ID: {b[0]}, Class: {b[1]}, Start_Time: {b[2]}, End_Time: {b[3]}")
+                print(f"Booking ID: {b[0]}, Class: {b[1]}, Date: {b[2]}, Start_Time: {b[3]}, End_Time: {b[4]}")
             print ("1. Cancel Booking")
             print ("2. Back")
             sub_choice = input("Select Option: ")
             if sub_choice == '1':
                 booking_id = input("Enter Booking ID to cancel: ")
                 success = db.cancel_booking(booking_id, id)
-                if success:
+                if success is True:
                     print("Booking cancelled successfully.")
                 else:
                     print("Cancellation failed.")
@@ -158,26 +173,57 @@ def member_manage_booking(db, id):
         else:
             print("No bookings found.")
     elif choice == '2':
-        schedule = db.get_available_classes()
-        print("=== Available Classes ===")
-        for entry in schedule:
-            # Handle both old format (5 items) and new format (7 items)
-            if len(entry) >= 7:
-                print(f"Schedule ID: {entry[0]}, Class: {entry[1]}, Room: {entry[2]}, Start Time: {entry[3]}, End Time: {entry[4]}, Bookings: {entry[5]}, Available Spots: {entry[6]}")
-            else:
-                print(f"Schedule ID: {entry[0]}, Class: {entry[1]}, Room: {entry[2]}, Start Time: {entry[3]}, End Time: {entry[4]}")
-        print ("1. Book a Class")
-        print ("2. Back")
-        sub_choice = input("Select Option: ")
-        if sub_choice == '1':
-            schedule_id = input("Enter Schedule ID to book: ")
-            success = db.book_class(id, schedule_id)
-            if success:
-                print("Class booked successfully.")
-            else:
-                print(f"Booking failed: {success}")
-        elif sub_choice == '2':
+        day_of_week = input("Filter by day of week (blank for all): ").strip() or None
+        class_name = input("Filter by class name (blank for all): ").strip() or None
+        only_available = input("Only show classes with free spots? (y/n): ").strip().lower() == 'y'
+        week_input = input("Week starting (YYYY-MM-DD, blank for today): ").strip()
+        try:
+            week_start = datetime.strptime(week_input, "%Y-%m-%d").date() if week_input else datetime.now().date()
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD")
             return
+        offset = 0
+        while True:
+            week_end = week_start + timedelta(days=6)
+            schedule = db.get_available_classes(day_of_week, class_name, only_available, CLASS_PAGE_SIZE, offset,
+                                                week_start, week_end, member_id=id)
+            print(f"=== Available Classes {week_start} to {week_end} ===")
+            for entry in schedule:
+                print(f"Occurrence ID: {entry[0]}, Date: {entry[1]}, Class: {entry[2]}, Room: {entry[3]}, Start Time: {entry[4]}, End Time: {entry[5]}, Bookings: {entry[6]}, Available Spots: {entry[7]}")
+            if not schedule:
+                print("No classes found.")
+            print ("1. Book a Class")
+            print ("2. Next Page")
+            print ("3. Previous Page")
+            print ("4. Next Week")
+            print ("5. Back")
+            sub_choice = input("Select Option: ")
+            if sub_choice == '1':
+                occurrence_id = input("Enter Occurrence ID to book: ")
+                if db.config["booking_queue"]:
+                    # queued mode: first come first served, with a waitlist when the class is full
+                    request_id = db.request_booking(id, occurrence_id)
+                    if isinstance(request_id, str):
+                        print(f"Booking failed: {request_id}")
+                    else:
+                        print(describe_outcome(wait_for_outcome(db, request_id, id)))
+                    return
+                success = db.book_class(id, occurrence_id)
+                if success is True:
+                    print("Class booked successfully.")
+                else:
+                    print(f"Booking failed: {success}")
+                return
+            elif sub_choice == '2':
+                if len(schedule) == CLASS_PAGE_SIZE:
+                    offset += CLASS_PAGE_SIZE
+            elif sub_choice == '3':
+                offset = max(0, offset - CLASS_PAGE_SIZE)
+            elif sub_choice == '4':
+                week_start = week_end + timedelta(days=1)
+                offset = 0
+            else:
+                return
     elif choice == '3':
         return
     
@@ -245,18 +291,29 @@ def trainer_view_schedule(db, id):
         print(f"Class: {entry[0]}, Room: {entry[1]}, Start Time: {entry[2]}, End Time: {entry[3]}")
     
 def trainer_search_member(db, id):
-    firstname = input("Enter member first name to search: ")
-    lastname = input("Enter member last name to search: ")
-    results = db.search_member_by_name(firstname, lastname)
-    if results:
-        print("=== Member Profile ===")
-        health_metrics = results[6]
-        print(f"Name: {results[1]} {results[2]}")
-        print(f"Fitness Goals: {results[5]}")
-        if health_metrics:
-            print(f"Recent Health Metrics: Weight - {health_metrics.weight}lbs, Height - {health_metrics.height}cm, Body Fat - {health_metrics.bodyfat}%")
-    else:
-        print("No members found.")
+    term = input("Enter member name or email to search: ")
+    offset = 0
+    while True:
+        results = db.search_members(term, MEMBER_PAGE_SIZE, offset)
+        print("=== Member Profiles ===")
+        for member in results:
+            health_metrics = member[5]
+            print(f"Member ID: {member[0]}, Name: {member[1]} {member[2]}, Email: {member[3]}, Fitness Goals: {member[4]}")
+            if health_metrics:
+                print(f"    Recent Health Metrics: Weight - {health_metrics.weight}lbs, Height - {health_metrics.height}cm, Body Fat - {health_metrics.bodyfat}%")
+        if not results:
+            print("No members found.")
+        print ("1. Next Page")
+        print ("2. Previous Page")
+        print ("3. Back")
+        sub_choice = input("Select Option: ")
+        if sub_choice == '1':
+            if len(results) == MEMBER_PAGE_SIZE:
+                offset += MEMBER_PAGE_SIZE
+        elif sub_choice == '2':
+            offset = max(0, offset - MEMBER_PAGE_SIZE)
+        else:
+            return
 
 def trainer_manage_availability(db, id):
     print("1. View/ Manage Availability")
@@ -320,7 +377,10 @@ def admin_page(db):
             print("1. Room Management")
             print("2. Class Management")
             print("3. Schedule Management")
-            print("4. Logout")
+            print("4. Group Bookings")
+            print("5. Reports")
+            print("6. Maintenance")
+            print("7. Logout")
             sub_choice = input("Select Option: ")
             if sub_choice == '1':
                 clear_screen()
@@ -335,6 +395,18 @@ def admin_page(db):
                 admin_schedule_management(db)
                 input("\nPress Enter to continue...")
             elif sub_choice == '4':
+                clear_screen()
+                admin_group_booking(db)
+                input("\nPress Enter to continue...")
+            elif sub_choice == '5':
+                clear_screen()
+                admin_reports(db)
+                input("\nPress Enter to continue...")
+            elif sub_choice == '6':
+                clear_screen()
+                admin_maintenance(db)
+                input("\nPress Enter to continue...")
+            elif sub_choice == '7':
                 break
     else:
         print("Login Failed.")
@@ -403,7 +475,8 @@ def admin_schedule_management(db):
     print("1. View Schedules")
     print("2. Remove Schedule")
     print("3. Add Schedule")
-    print("4. Back")
+    print("4. Generate Weekly Timetable")
+    print("5. Back")
     choice = input("Select Option: ")
     if choice == '1':
         schedules = db.get_all_schedules()
@@ -419,11 +492,216 @@ def admin_schedule_management(db):
             print("Removal failed.")
     elif choice == '3':
         admin_add_schedule(db)
+    elif choice == '4':
+        admin_generate_timetable(db)
+    elif choice == '5':
+        return
+
 
+def admin_group_booking(db):
+    print("1. Book Members Into Classes")
+    print("2. Cancel Members From Classes")
+    print("3. Back")
+    choice = input("Select Option: ")
+    if choice not in ('1', '2'):
+        return
+    try:
+        member_ids = [int(m) for m in input("Enter member IDs (comma separated): ").split(",") if m.strip()]
+        occurrence_ids = [int(o) for o in input("Enter class occurrence IDs (comma separated): ").split(",") if o.strip()]
+    except ValueError:
+        print("IDs must be numbers.")
+        return
+
+    # every member is booked into (or cancelled from) every listed occurrence
+    pairs = [(member_id, occurrence_id) for occurrence_id in occurrence_ids for member_id in member_ids]
+    if choice == '1':
+        results = db.book_many(pairs)
+    else:
+        results = db.cancel_many(pairs)
 
+    if isinstance(results, str):
+        print(f"Group operation failed: {results}")
+        return
+    print("=== Results ===")
+    for (member_id, occurrence_id), status in zip(pairs, results):
+        print(f"Member ID: {member_id}, Occurrence ID: {occurrence_id}, Result: {status}")
+    summary = {}
+    for status in results:
+        summary[status] = summary.get(status, 0) + 1
+    print("Summary: " + ", ".join(f"{status}: {count}" for status, count in summary.items()))
+
+
+def percent(value):
+    return "-" if value is None else f"{value:.0%}"
+
+
+def admin_reports(db):
+    print("1. Room Occupancy by Weekday and Hour")
+    print("2. Trainer Teaching Load")
+    print("3. Class Fill Ratio")
+    print("4. Back")
+    choice = input("Select Option: ")
+    if choice not in ('1', '2', '3'):
+        return
+    # the rollups only take in classes that have already taken place
+    refreshed = db.refresh_report_rollups()
+    if isinstance(refreshed, str):
+        print(f"Report refresh failed: {refreshed}")
+        return
+    coverage = db.get_report_coverage()
+    if coverage is None or coverage[0] is None:
+        print("No classes have taken place yet.")
+        return
+    print(f"Covering classes held from {coverage[0]} through {coverage[1]}")
+
+    if choice == '1':
+        room_id = input("Enter room ID (blank for all rooms): ").strip()
+        if room_id and not room_id.isdigit():
+            print("Room ID must be a number.")
+            return
+        rows = db.get_room_occupancy(int(room_id) if room_id else None)
+        if not rows:
+            print("No classes held in this room yet.")
+        rooms = {}
+        for row in rows:
+            rooms.setdefault((row[0], row[1]), []).append(row)
+        for (room_id, room_name), room_rows in rooms.items():
+            hours = sorted({row[3] for row in room_rows})
+            occupancy = {(row[2], row[3]): row[4] for row in room_rows}
+            print(f"\n=== {room_name} (Room ID: {room_id}): share of each hour in use ===")
+            print(f"{'':<11}" + "".join(f"{hour:>5}" for hour in hours))
+            for day in dict.fromkeys(row[2] for row in room_rows):
+                print(f"{day:<11}" + "".join(f"{percent(occupancy.get((day, hour))):>5}" for hour in hours))
+            busiest = sorted((row for row in room_rows if row[6] <= 3), key=lambda row: row[6])
+            print("Busiest: " + ", ".join(f"{row[2]} {row[3]:02d}:00 ({percent(row[4])} in use, {percent(row[5])} of seats booked)"
+                                          for row in busiest))
+    elif choice == '2':
+        weeks = input("Number of past weeks (default 4): ").strip() or "4"
+        if not weeks.isdigit() or int(weeks) < 1:
+            print("Weeks must be a positive number.")
+            return
+        rows = db.get_trainer_load(int(weeks))
+        print(f"=== Trainer Load (last {weeks} complete weeks) ===")
+        print(f"{'Rank':<6}{'Trainer':<28}{'Classes':>8}{'Hours/wk':>10}{'Declared/wk':>13}{'Utilization':>13}")
+        for row in rows:
+            print(f"{row[6]:<6}{row[1]:<28}{row[2]:>8}{row[3]:>10}{row[4]:>13}{percent(row[5]):>13}")
+        if rows:
+            print(f"Club average: {rows[0][7]} teaching hours per trainer per week")
+    elif choice == '3':
+        weeks = input("Number of past weeks (default 4): ").strip() or "4"
+        if not weeks.isdigit() or int(weeks) < 1:
+            print("Weeks must be a positive number.")
+            return
+        rows = db.get_class_fill(int(weeks))
+        if not rows:
+            print("No classes held in that period.")
+        current = None
+        for row in rows:
+            if row[0] != current:
+                current = row[0]
+                print(f"\n=== {row[1]} (Class ID: {row[0]}): {percent(row[8])} of seats booked over the period ===")
+                print(f"{'Week of':<12}{'Classes':>8}{'Booked':>8}{'Seats':>8}{'Fill':>7}{'Change':>8}")
+            change = "-" if row[7] is None else f"{row[7] * 100:+.0f}pt"
+            print(f"{str(row[2]):<12}{row[3]:>8}{row[4]:>8}{row[5]:>8}{percent(row[6]):>7}{change:>8}")
+
+
+def admin_maintenance(db):
+    print("1. Rebuild Member Dashboard")
+    print("2. View Connection Pool Stats")
+    print("3. Bulk Import Members (CSV/JSONL)")
+    print("4. View Reference Cache Stats")
+    print("5. Maintain Health Metric Partitions")
+    print("6. Query Instrumentation")
+    print("7. Back")
+    choice = input("Select Option: ")
+    if choice == '1':
+        result = db.rebuild_member_dashboard()
+        if isinstance(result, int):
+            print(f"Member dashboard rebuilt ({result} members).")
+        else:
+            print(f"Rebuild failed: {result}")
+    elif choice == '2':
+        print("=== Connection Pool ===")
+        for key, value in db.get_pool_stats().items():
+            print(f"{key}: {value}")
+        replicas = db.get_replica_stats()
+        if replicas:
+            print(f"=== Read Replicas ({replicas['strategy']}) ===")
+            for replica in replicas['replicas']:
+                if replica['usable']:
+                    state = f"lag {replica['lag_ms']} ms"
+                else:
+                    state = f"skipped ({replica['error'] or 'lag ' + str(replica['lag_ms']) + ' ms'})"
+                print(f"{replica['url']}: {state}, reads: {replica['reads']}, connections in use: {replica['connections']}")
+            print(f"Reads sent to the primary: {replicas['primary_reads']['sticky']} after the member's own write, "
+                  f"{replicas['primary_reads']['lagging']} with no replica current enough")
+    elif choice == '3':
+        path = input("Enter path to CSV/JSONL file: ").strip()
+        if not os.path.isfile(path):
+            print("File not found.")
+            return
+        result = db.import_members(path)
+        print(f"Members imported: {result['members']}")
+        print(f"Health metrics imported: {result['health_metrics']}")
+        print(f"Rows rejected: {result['rejected']} (see {result['rejects_path']})")
     elif choice == '4':
+        print("=== Reference Cache ===")
+        for key, value in db.get_cache_stats().items():
+            print(f"{key}: {value}")
+    elif choice == '5':
+        migrated = db.migrate_health_metrics()
+        if not isinstance(migrated, int):
+            print(f"Migration failed: {migrated}")
+            return
+        created = db.create_metric_partitions()
+        if isinstance(created, int):
+            print(f"Health metric partitions created: {created}")
+        else:
+            print(f"Partition maintenance failed: {created}")
+    elif choice == '6':
+        admin_instrumentation(db)
+    elif choice == '7':
+        return
+
+
+def admin_instrumentation(db):
+    report = db.get_instrumentation_report()
+    if report is None:
+        if input("Query instrumentation is off. Turn it on? (y/n): ").strip().lower() == 'y':
+            db.enable_instrumentation()
+            print("Instrumentation on. Use the app, then come back here for the report.")
         return
 
+    print(f"=== Query Instrumentation (since {report['since']}, slow >= {report['slow_query_ms']} ms) ===")
+    print(f"{'Method':<30}{'Calls':>7}{'Stmts/call':>11}{'Rows':>9}{'DB ms':>11}{'Pool ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, stats in report['methods'].items():
+        print(f"{name:<30}{stats['calls']:>7}{stats['statements_per_call']:>11}{stats['rows']:>9}{stats['db_ms']:>11}"
+              f"{stats['pool_wait_ms']:>10}{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+    print("1. View Latency Histograms")
+    print("2. View Slow Queries")
+    print("3. Reset Statistics")
+    print("4. Turn Instrumentation Off")
+    print("5. Back")
+    choice = input("Select Option: ")
+    if choice == '1':
+        for name, stats in report['methods'].items():
+            buckets = ", ".join(f"{bucket}: {count}" for bucket, count in stats['histogram'].items() if count)
+            print(f"{name}: {buckets}")
+    elif choice == '2':
+        if not report['slow_queries']:
+            print("No slow queries logged.")
+        for entry in report['slow_queries']:
+            print(f"\n[{entry['at']}] {entry['method']} - {entry['ms']} ms")
+            print(entry['statement'])
+            print(f"Parameters: {entry['parameters']}")
+            print(entry['plan'] or "(no plan)")
+    elif choice == '3':
+        db.instrumentation.reset()
+        print("Statistics reset.")
+    elif choice == '4':
+        db.disable_instrumentation()
+        print("Instrumentation off.")
+
 
 def admin_add_schedule(db):
         # get dates
@@ -451,7 +729,7 @@ def admin_add_schedule(db):
             return
 
         # display available rooms 
-        rooms = db.get_available_rooms(start_dt, end_dt)
+        rooms = db.get_available_rooms(day_of_week, start_dt, end_dt)
         print("=== Rooms ===")
         if isinstance(rooms, str):
             print(f"Error fetching rooms: {rooms}")
@@ -478,15 +756,88 @@ def admin_add_schedule(db):
         room_id = input("Enter room ID to schedule: ")
         trainer_id = input("Enter trainer ID to schedule: ")
         success = db.add_schedule(class_id, room_id, trainer_id,day_of_week, start_dt, end_dt)
-        if success:
+        if isinstance(success, int):
             print("Schedule added successfully.")
         else:
-            print("Addition failed.")
+            print(f"Addition failed: {success}")
         
 
 
+def admin_generate_timetable(db):
+    classes = db.get_all_classes()
+    if isinstance(classes, str) or not classes:
+        print(f"No classes to schedule. {classes if isinstance(classes, str) else ''}")
+        return
+
+    # sessions per week, minimum room size and trainer specialization for each class; 0 sessions skips it
+    requests = []
+    print("=== Classes ===")
+    for class_id, name, _, duration in classes:
+        print(f"Class ID: {class_id}, Name: {name}, Duration: {duration} mins")
+        try:
+            sessions = int(input("  Sessions per week (0 to skip): ") or 0)
+            if sessions <= 0:
+                continue
+            min_capacity = int(input("  Minimum room capacity (blank for any): ") or 0)
+        except ValueError:
+            print("Please enter whole numbers.")
+            return
+        specialization = input("  Trainer specialization (blank for any): ").strip()
+        requests.append(ClassRequest(class_id, sessions, min_capacity, specialization))
+    if not requests:
+        return
+
+    plan = generate_timetable(db, requests)
+    if isinstance(plan, str):
+        print(f"Could not load scheduling data: {plan}")
+        return
+
+    names = {c[0]: c[1] for c in classes}
+    print(f"=== Proposed Timetable ({len(plan.placements)} sessions, solved in {plan.seconds}s) ===")
+    for class_id, room_id, trainer_id, day_of_week, start_time, end_time in plan.rows():
+        print(f"{day_of_week:<9} {start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')}  "
+              f"{names[class_id]}  Room ID: {room_id}  Trainer ID: {trainer_id}")
+    for class_id, reason in plan.unplaced:
+        print(f"Not placed: {names.get(class_id, class_id)} ({reason})")
+    if not plan.placements:
+        return
+
+    if input("Add these sessions to the schedule? (y/n): ").strip().lower() != 'y':
+        print("Timetable discarded.")
+        return
+    schedule_ids = db.apply_timetable(plan.rows())
+    if isinstance(schedule_ids, list):
+        print(f"{len(schedule_ids)} schedules added.")
+    else:
+        print(f"Timetable not applied: {schedule_ids}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fitness club management system")
+    parser.add_argument("--serve", action="store_true", help="run the JSON/HTTP service instead of the menu")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--request-timeout", type=float, default=10.0, help="seconds before a request gets a 504")
+    parser.add_argument("--idle-timeout", type=float, default=15.0, help="seconds an idle keep-alive connection stays open")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--sync-workers", type=int, default=8, help="threads for operations only DBManager provides")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.serve:
+        from service import run_service
+        run_service(args.host, args.port, args.request_timeout, args.idle_timeout, args.max_connections, args.sync_workers)
+        sys.exit(0)
+
     db = DBManager()
+    # one query against a current database; missing migrations are applied otherwise
+    schema = db.ensure_schema()
+    if isinstance(schema, str):
+        print(f"Database schema check failed: {schema}")
+        db.close()
+        sys.exit(1)
 
     while True:
         clear_screen()
@@ -509,7 +860,15 @@ if __name__ == "__main__":
             admin_page(db)
         elif choice == '4':
             clear_screen()
-            db.reset_db()
+            print("1. Fast Reset (empty all tables and reload sample data)")
+            print("2. Full Rebuild (drop and recreate the schema)")
+            print("3. Back")
+            reset_choice = input("Select Option: ")
+            if reset_choice == '1':
+                result = db.fast_reset()
+                print("Database reset." if result is True else f"Reset failed: {result}")
+            elif reset_choice == '2':
+                db.reset_db()
             input("\nPress Enter to continue...")
         elif choice == '5':
             print("Exiting...")
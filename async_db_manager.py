@@ -0,0 +1,278 @@
+# async_db_manager.py
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import queries
+from cache import CACHE_CHANNEL
+from credentials import CredentialVerifier, needs_rehash
+from db_manager import load_db_config
+
+
+class AsyncDBManager:
+    # asyncio counterpart of DBManager built on asyncpg, so many I/O-bound requests can
+    # interleave on one event loop. Every method runs the same statement from queries.py as
+    # its DBManager twin and returns the same values.
+    def __init__(self, config=None):
+        self.config = config or load_db_config()
+        self.engine = self.create_db_engine(self.config)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.credentials = CredentialVerifier(workers=self.config["hash_workers"])
+        # see DBManager.ensure_occurrences
+        self._occurrences_through = None
+
+    @staticmethod
+    def create_db_engine(config):
+        # asyncpg prepares each statement server-side once per connection and reuses it; with
+        # PgBouncer in transaction mode the prepared statements do not survive, so the size is 0
+        url = make_url(config["url"]).set(drivername="postgresql+asyncpg").update_query_dict(
+            {"prepared_statement_cache_size": str(config["prepared_statement_cache_size"])}
+        )
+        connect_args = {}
+        if config["statement_timeout"]:
+            connect_args["server_settings"] = {"statement_timeout": str(config["statement_timeout"])}
+
+        if config["pool_mode"] == "null":
+            return create_async_engine(url, poolclass=NullPool,
+                                       pool_pre_ping=config["pool_pre_ping"], connect_args=connect_args)
+        return create_async_engine(
+            url,
+            pool_size=config["pool_size"],
+            max_overflow=config["max_overflow"],
+            pool_timeout=config["pool_timeout"],
+            pool_pre_ping=config["pool_pre_ping"],
+            pool_recycle=config["pool_recycle"],
+            connect_args=connect_args,
+        )
+
+    async def close(self):
+        self.credentials.shutdown()
+        await self.engine.dispose()
+
+    def get_pool_stats(self):
+        pool = self.engine.pool
+        stats = {"mode": self.config["pool_mode"]}
+        if hasattr(pool, "checkedout"):
+            stats["pool_size"] = pool.size()
+            stats["checked_in"] = pool.checkedin()
+            stats["checked_out"] = pool.checkedout()
+            stats["overflow"] = max(pool.overflow(), 0)
+        return stats
+
+    async def notify_reference_change(self, session, *keys):
+        # keeps the reference caches of sync DBManager processes coherent with writes made here
+        if self.config["cache_notify"]:
+            await session.execute(text("SELECT pg_notify(:channel, :keys)"), {"channel": CACHE_CHANNEL, "keys": ",".join(keys)})
+
+    async def _fetch_all(self, stmt):
+        async with self.Session() as session:
+            result = await session.execute(stmt)
+            return [tuple(row) for row in result]
+
+    async def _write(self, stmt, *cache_keys):
+        # runs one statement returning a single value in its own transaction
+        async with self.Session() as session:
+            try:
+                value = (await session.execute(stmt)).scalar()
+                if cache_keys and value is not None:
+                    await self.notify_reference_change(session, *cache_keys)
+                await session.commit()
+                return value
+            except Exception:
+                await session.rollback()
+                raise
+
+    # LOGIN ----------------------------------------------------------------------------------------
+    async def _check_credentials(self, role, identity, password):
+        # same flow as DBManager._check_credentials; hashing runs on the credential thread pool
+        attempt_key = (role, identity)
+        if self.credentials.attempts.is_locked(attempt_key):
+            return None
+
+        async with self.Session() as session:
+            account = (await session.execute(queries.credential_lookup(role, identity))).first()
+
+        stored = account[1] if account else None
+        if not await asyncio.wrap_future(self.credentials.submit_verify(password, stored)):
+            self.credentials.attempts.record_failure(attempt_key)
+            return None
+        self.credentials.attempts.record_success(attempt_key)
+
+        if needs_rehash(stored):
+            new_hash = await asyncio.wrap_future(self.credentials.submit_hash(password))
+            async with self.Session() as session:
+                try:
+                    await session.execute(queries.password_upgrade(role, account[0], stored, new_hash))
+                    await session.commit()
+                except Exception:
+                    await session.rollback()
+        return account[0]
+
+    async def member_login(self, email, password):
+        try:
+            return await self._check_credentials("member", email, password)
+        except Exception:
+            return None
+
+    async def trainer_login(self, email, password):
+        try:
+            return await self._check_credentials("trainer", email, password)
+        except Exception:
+            return None
+
+    async def admin_login(self, username, password):
+        try:
+            return await self._check_credentials("admin", username, password) is not None
+        except Exception:
+            return False
+
+    # MEMBER OPERATIONS ----------------------------------------------------------------------------
+    async def get_member_profile(self, member_id):
+        async with self.Session() as session:
+            row = (await session.execute(queries.member_profile(member_id))).first()
+            return queries.format_member_profile(row)
+
+    async def get_metric_series(self, member_ids, bucket="week", start=None, end=None):
+        if isinstance(member_ids, (int, str)):
+            member_ids = [member_ids]
+        try:
+            return await self._fetch_all(queries.metric_series(member_ids, bucket, start, end))
+        except Exception as e:
+            return str(e)
+
+    async def get_member_bookings(self, member_id):
+        return await self._fetch_all(queries.member_bookings(member_id))
+
+    async def ensure_occurrences(self):
+        start, end = queries.occurrence_window(self.config["occurrence_horizon_days"])
+        if self._occurrences_through is not None and self._occurrences_through >= end:
+            return 0
+        try:
+            async with self.engine.begin() as conn:
+                created = (await conn.execute(queries.ensure_occurrences(start, end))).scalar()
+            self._occurrences_through = end
+            return created
+        except Exception as e:
+            return str(e)
+
+    async def get_available_classes(self, day_of_week=None, class_name=None, only_available=False, limit=None, offset=0,
+                                    start_date=None, end_date=None):
+        await self.ensure_occurrences()
+        stmt = queries.available_classes(day_of_week, class_name, only_available, limit, offset, start_date, end_date)
+        return [queries.format_available_class(row) for row in await self._fetch_all(stmt)]
+
+    async def book_class(self, member_id, occurrence_id):
+        try:
+            if await self._write(queries.insert_booking(member_id, occurrence_id)) is None:
+                return "Class not found or already taken place"
+            return True
+        except Exception as e:
+            return queries.booking_error_message(e)
+
+    async def cancel_booking(self, booking_id, member_id):
+        try:
+            if await self._write(queries.delete_member_booking(booking_id, member_id)) is not None:
+                return True
+            return "Booking not found"
+        except Exception as e:
+            return str(e)
+
+    async def request_booking(self, member_id, occurrence_id):
+        try:
+            request_id = await self._write(queries.insert_booking_request(member_id, occurrence_id))
+            return "Class not found or already taken place" if request_id is None else request_id
+        except Exception as e:
+            return str(e)
+
+    async def get_booking_request(self, request_id, member_id):
+        rows = await self._fetch_all(queries.booking_request(request_id, member_id))
+        return rows[0] if rows else "Request not found"
+
+    async def cancel_booking_request(self, request_id, member_id):
+        try:
+            if await self._write(queries.cancel_booking_request(request_id, member_id)) is not None:
+                return True
+            return "Request not found or already decided"
+        except Exception as e:
+            return str(e)
+
+    # TRAINER OPERATIONS ---------------------------------------------------------------------------
+    async def get_trainer_schedule(self, trainer_id):
+        return await self._fetch_all(queries.trainer_schedule(trainer_id))
+
+    async def search_members(self, term, limit=10, offset=0):
+        return [queries.format_member_search(row) for row in await self._fetch_all(queries.member_search(term, limit, offset))]
+
+    # ADMIN OPERATIONS -----------------------------------------------------------------------------
+    async def get_all_classes(self):
+        return await self._fetch_all(queries.all_classes())
+
+    async def add_class(self, name, description, duration):
+        try:
+            return await self._write(queries.insert_class(name, description, duration), "classes", "schedules")
+        except Exception as e:
+            return str(e)
+
+    async def remove_class(self, class_id):
+        try:
+            if await self._write(queries.delete_class(class_id), "classes", "schedules") is not None:
+                return True
+            return "Class not found"
+        except Exception as e:
+            return str(e)
+
+    async def get_all_rooms(self):
+        return await self._fetch_all(queries.all_rooms())
+
+    async def add_room(self, room_name, capacity):
+        try:
+            return await self._write(queries.insert_room(room_name, capacity), "rooms", "schedules")
+        except Exception as e:
+            return str(e)
+
+    async def remove_room(self, room_id):
+        try:
+            if await self._write(queries.delete_room(room_id), "rooms", "schedules") is not None:
+                return True
+            return "Room not found"
+        except Exception as e:
+            return str(e)
+
+    async def get_all_schedules(self):
+        return await self._fetch_all(queries.all_schedules())
+
+    async def add_schedule(self, class_id, room_id, trainer_id, day_of_week, start_time, end_time):
+        async with self.Session() as session:
+            try:
+                schedule_id = (await session.execute(
+                    queries.insert_schedule(class_id, room_id, trainer_id, day_of_week, start_time, end_time)
+                )).scalar()
+                # the trainer's availability slot covering this time is used up
+                await session.execute(queries.consume_availability(trainer_id, day_of_week, start_time, end_time))
+                # bookable right away: the new schedule's occurrences over the horizon
+                window = queries.occurrence_window(self.config["occurrence_horizon_days"])
+                await session.execute(queries.ensure_occurrences(*window, schedule_id))
+                await self.notify_reference_change(session, "schedules")
+                await session.commit()
+                return schedule_id
+            except Exception as e:
+                await session.rollback()
+                return queries.schedule_error_message(e)
+
+    async def remove_schedule(self, schedule_id):
+        async with self.Session() as session:
+            try:
+                # delete associated bookings first, then the schedule itself (its occurrences cascade)
+                await session.execute(queries.delete_schedule_bookings(schedule_id))
+                if (await session.execute(queries.delete_schedule(schedule_id))).first():
+                    await self.notify_reference_change(session, "schedules")
+                    await session.commit()
+                    return True
+                await session.rollback()
+                return "Schedule not found"
+            except Exception as e:
+                await session.rollback()
+                return str(e)
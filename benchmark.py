@@ -0,0 +1,268 @@
+# benchmark.py
+# Times the public DBManager operations against generated datasets of several sizes and writes
+# a JSON report; --compare flags operations that got slower than a previous report. Each scale
+# resets the database, so point FITNESS_DB_URL at a scratch database.
+#
+#   python benchmark.py --scales tiny,small --output report.json
+#   python benchmark.py --scales small --compare report.json --threshold 1.25
+#   python benchmark.py --overhead 5000
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, time as dt_time
+
+from sqlalchemy import event, select
+
+import datagen
+import queries
+from db_manager import DBManager, SAMPLE_DATA
+from models import Admin, Member, Trainer
+
+SCALES = {
+    "tiny": {"members": 1000, "trainers": 20, "rooms": 10, "classes": 10, "schedules": 500,
+             "bookings": 5000, "metrics": 10000},
+    "small": {"members": 100000, "trainers": 100, "rooms": 40, "classes": 20, "schedules": 4000,
+              "bookings": 60000, "metrics": 1000000},
+    "large": {"members": 1000000, "trainers": 300, "rooms": 100, "classes": 40, "schedules": 10000,
+              "bookings": 200000, "metrics": 10000000},
+}
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "calls": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+
+def operations(db, ids, rng):
+    # name -> zero-argument function making one call with random arguments from the generated id ranges
+    def member():
+        return rng.randint(*ids["member"])
+
+    def occurrence():
+        return rng.randint(*ids["occurrence"])
+
+    def slot():
+        hour = rng.randrange(datagen.FIRST_HOUR, datagen.FIRST_HOUR + datagen.HOURS_PER_DAY)
+        return rng.choice(datagen.DAYS), dt_time(hour, 0), dt_time(hour, 45)
+
+    def book():
+        member_id, occurrence_id = member(), occurrence()
+        result = db.book_class(member_id, occurrence_id)
+        return result, (member_id, occurrence_id)
+
+    return {
+        "member_login": lambda: db.member_login(f"member{member()}@example.com", datagen.DATAGEN_PASSWORD),
+        "get_member_profile": lambda: db.get_member_profile(member()),
+        "get_member_bookings": lambda: db.get_member_bookings(member()),
+        "get_metric_series": lambda: db.get_metric_series(member(), "week"),
+        "get_available_classes": lambda: db.get_available_classes(rng.choice(datagen.DAYS), None, True, 10, 0),
+        "get_available_classes_by_name": lambda: db.get_available_classes(None, rng.choice(datagen.CLASS_NAMES), False, 10, 0),
+        "search_members": lambda: db.search_members(f"{rng.choice(datagen.FIRST_NAMES)} {rng.choice(datagen.LAST_NAMES)}"),
+        "get_trainer_schedule": lambda: db.get_trainer_schedule(rng.randint(*ids["trainer"])),
+        "get_available_rooms": lambda: db.get_available_rooms(*slot()),
+        "get_available_trainers": lambda: db.get_available_trainers(*slot()),
+        "get_all_schedules": lambda: db.get_all_schedules(),
+        "book_class": book,
+    }
+
+
+def time_operation(db, name, operation, iterations, warmup):
+    samples = []
+    booked = []
+    for i in range(warmup + iterations):
+        started = time.perf_counter()
+        result = operation()
+        elapsed = time.perf_counter() - started
+        if name == "book_class":
+            outcome, pair = result
+            if outcome is True:
+                booked.append(pair)
+        if i >= warmup:
+            samples.append(elapsed)
+    # bookings made by the benchmark are removed so the next operation sees the generated data
+    if booked:
+        db.cancel_many(booked)
+    return summarize(samples)
+
+
+def run_scale(db, name, volumes, seed, iterations, warmup):
+    print(f"\n=== {name}: generating dataset ===")
+    generated = datagen.generate(db, volumes, seed, reset=True)
+    rng = random.Random(seed)
+    results = {}
+    for operation_name, operation in operations(db, generated["ids"], rng).items():
+        # the credential check is deliberately slow, so it gets fewer calls
+        calls = max(1, iterations // 10) if operation_name == "member_login" else iterations
+        results[operation_name] = time_operation(db, operation_name, operation, calls, warmup)
+        print(f"{operation_name:<32} p50 {results[operation_name]['p50_ms']:>9} ms   p99 {results[operation_name]['p99_ms']:>9} ms")
+    return {"volumes": generated["volumes"], "load_seconds": generated["seconds"], "operations": results}
+
+
+class CursorClock:
+    # total time spent inside cursor.execute on an engine, so the Python side of a call can be
+    # separated from the database round trip
+    def __init__(self, engine):
+        self.engine = engine
+        self.seconds = 0.0
+        self._started = None
+
+    def _before(self, *args):
+        self._started = time.perf_counter()
+
+    def _after(self, *args):
+        self.seconds += time.perf_counter() - self._started
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        event.listen(self.engine, "after_cursor_execute", self._after)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+
+
+def hot_path_statements(member_id, occurrence_id):
+    # name -> (plain builder, cached lambda builder) for the login and booking hot paths; booking
+    # builders take the previous call's result so each cancel removes the booking just made
+    def sample(model, key):
+        return next(row[key] for table, rows in SAMPLE_DATA if table is model for row in rows)
+
+    statements = {}
+    for role, model, key in (("member", Member, "email"), ("trainer", Trainer, "email"), ("admin", Admin, "username")):
+        target, identity_column, id_column = queries.CREDENTIAL_TARGETS[role]
+        identity = sample(model, key)
+        statements[f"{role}_login"] = (
+            lambda _, id_column=id_column, password=target.password, column=identity_column, identity=identity:
+                queries.credential_select(id_column, password, column, identity),
+            lambda _, role=role, identity=identity: queries.credential_lookup(role, identity),
+        )
+    statements["book_class"] = (lambda _: queries.booking_insert(member_id, occurrence_id),
+                                lambda _: queries.insert_booking(member_id, occurrence_id))
+    statements["cancel_booking"] = (lambda booking_id: queries.member_booking_delete(booking_id, member_id),
+                                    lambda booking_id: queries.delete_member_booking(booking_id, member_id))
+    return statements
+
+
+def statement_overhead(db, calls, warmup):
+    # Python time per call (wall time minus time inside cursor.execute) of each hot path statement,
+    # built plain on every call and as the cached lambda statement the app uses. Runs against the
+    # sample data in one transaction that is rolled back, booking and cancelling in turn.
+    reset = db.fast_reset()
+    if reset is not True:
+        sys.exit(f"Reset failed: {reset}")
+    with db.engine.connect() as conn:
+        # member 1 and the next occurrence of schedule 1, both from the sample data
+        occurrence_id = conn.execute(select(queries.next_occurrence(1))).scalar()
+        statements = hot_path_statements(1, occurrence_id)
+        results = {}
+        with CursorClock(db.engine) as clock:
+            for variant, index in (("plain", 0), ("cached", 1)):
+                python = dict.fromkeys(statements, 0.0)
+                for i in range(warmup + calls):
+                    value = None
+                    for name, builders in statements.items():
+                        in_cursor = clock.seconds
+                        started = time.perf_counter()
+                        value = conn.execute(builders[index](value)).scalar()
+                        if i >= warmup:
+                            python[name] += time.perf_counter() - started - (clock.seconds - in_cursor)
+                for name, seconds in python.items():
+                    results.setdefault(name, {})[f"{variant}_us"] = round(seconds / calls * 1e6, 1)
+        conn.rollback()
+    for stats in results.values():
+        stats["speedup"] = round(stats["plain_us"] / stats["cached_us"], 2) if stats["cached_us"] else None
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    # returns (scale, operation, baseline p50, current p50) for every operation slower than threshold x
+    regressions = []
+    for scale, current in report["scales"].items():
+        previous = baseline.get("scales", {}).get(scale)
+        if not previous:
+            continue
+        for operation, stats in current["operations"].items():
+            before = previous["operations"].get(operation)
+            if before and before["p50_ms"] > 0 and stats["p50_ms"] / before["p50_ms"] > threshold:
+                regressions.append((scale, operation, before["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark DBManager operations at several data scales (resets the database)")
+    parser.add_argument("--scales", default="tiny", help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--compare", help="previous report to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 ratio counted as a regression")
+    parser.add_argument("--overhead", type=int, metavar="CALLS",
+                        help="instead of the scales, time the Python overhead per call of the login and booking "
+                             "statements, plain versus cached, over CALLS calls on the sample data")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        sys.exit(f"Unknown scales: {', '.join(unknown)}")
+
+    db = DBManager()
+    report = {
+        "generated_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "seed": args.seed,
+        "iterations": args.iterations,
+        "scales": {},
+    }
+    try:
+        if args.overhead:
+            report["statement_overhead"] = statement_overhead(db, args.overhead, args.warmup)
+            print(f"{'Statement':<18}{'plain us':>10}{'cached us':>11}{'speedup':>9}")
+            for name, stats in report["statement_overhead"].items():
+                print(f"{name:<18}{stats['plain_us']:>10}{stats['cached_us']:>11}{stats['speedup']:>8}x")
+        else:
+            for scale in scales:
+                report["scales"][scale] = run_scale(db, scale, SCALES[scale], args.seed, args.iterations, args.warmup)
+    finally:
+        db.close()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for scale, operation, before, after in regressions:
+            print(f"REGRESSION {scale}/{operation}: p50 {before} ms -> {after} ms")
+        if regressions:
+            sys.exit(1)
+        print("No regressions.")
@@ -0,0 +1,119 @@
+# booking_queue.py
+# Queued booking admission. With booking_queue enabled, members' booking attempts are stored in
+# booking_request (DBManager.request_booking) instead of racing each other into the
+# enforce_capacity trigger. Workers drain the queue with DBManager.process_booking_requests: each
+# batch locks the class occurrences it admits to with FOR UPDATE SKIP LOCKED, so any number of
+# workers, in one process or several, share the queue without waiting on each other, and every
+# occurrence's requests are decided strictly in request order.
+#
+#   python booking_queue.py --workers 8 --batch-size 200
+import threading
+import time
+
+
+class BookingWorkerPool:
+    def __init__(self, db, workers=4, batch_size=100, idle_sleep=0.05, max_idle_sleep=1.0):
+        self.db = db
+        self.workers = workers
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.max_idle_sleep = max_idle_sleep
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.batches = 0
+        self.errors = 0
+        self.decided = {"booked": 0, "waitlisted": 0, "duplicate": 0}
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"booking-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=self.max_idle_sleep + 5)
+        self._threads = []
+
+    def _run(self):
+        # back off while the queue is empty, go straight to the next batch while there is work
+        sleep = self.idle_sleep
+        while not self._stop.is_set():
+            result = self.db.process_booking_requests(self.batch_size)
+            if isinstance(result, str):
+                with self._lock:
+                    self.errors += 1
+                self._stop.wait(self.max_idle_sleep)
+                continue
+            if any(result.values()):
+                with self._lock:
+                    self.batches += 1
+                    for outcome, count in result.items():
+                        self.decided[outcome] += count
+                sleep = self.idle_sleep
+                continue
+            self._stop.wait(sleep)
+            sleep = min(sleep * 2, self.max_idle_sleep)
+
+    def stats(self):
+        with self._lock:
+            return {"workers": len(self._threads), "batch_size": self.batch_size, "batches": self.batches,
+                    "errors": self.errors, **self.decided}
+
+
+def wait_for_outcome(db, request_id, member_id, timeout=10.0, interval=0.05):
+    # polls until a worker has decided the request; returns get_booking_request's row (still
+    # "pending" after timeout) or an error string
+    deadline = time.monotonic() + timeout
+    while True:
+        row = db.get_booking_request(request_id, member_id)
+        if isinstance(row, str) or row[2] != "pending" or time.monotonic() >= deadline:
+            return row
+        time.sleep(interval)
+
+
+def describe_outcome(row):
+    if isinstance(row, str):
+        return f"Booking failed: {row}"
+    request_id, occurrence_id, status, booking_id, position = row
+    if status == "booked":
+        return f"Class booked successfully (Booking ID: {booking_id})."
+    if status == "waitlisted":
+        return f"Class is full; you are number {position} on the waitlist (Request ID: {request_id})."
+    if status == "duplicate":
+        return "You are already booked into this class."
+    if status == "pending":
+        return f"Booking request {request_id} is queued; check back shortly."
+    return f"Booking request {request_id} is {status}."
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db_manager import DBManager, load_db_config
+
+    parser = argparse.ArgumentParser(description="Run booking queue workers")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to booking_workers from the config")
+    parser.add_argument("--batch-size", type=int, default=None, help="defaults to booking_batch_size from the config")
+    args = parser.parse_args()
+
+    config = load_db_config()
+    # this process only runs the workers started below
+    workers = args.workers or config["booking_workers"] or 1
+    batch_size = args.batch_size or config["booking_batch_size"]
+    config["booking_queue"] = False
+    db = DBManager(config)
+    pool = BookingWorkerPool(db, workers, batch_size).start()
+    print(f"{workers} booking workers running (batch size {batch_size}); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print(pool.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+        db.close()
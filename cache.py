@@ -0,0 +1,113 @@
+# cache.py
+import select
+import threading
+import time
+
+import psycopg2
+
+# Channel used by DBManager to tell other app processes which reference data changed
+CACHE_CHANNEL = "reference_cache"
+
+
+class ReferenceCache:
+    # In-process read-through cache for data that changes rarely (rooms, classes, schedules).
+    # Entries expire after ttl seconds or when a write invalidates their key.
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        # bumped on every invalidation so a load that raced with a write is not stored
+        self._generations = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return list(entry[1])
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(key, 0))
+
+        value = loader()
+        # loaders return an error string on failure; never cache those
+        if isinstance(value, list):
+            with self._lock:
+                if (self._epoch, self._generations.get(key, 0)) == generation:
+                    self._entries[key] = (now + self.ttl, value)
+            return list(value)
+        return value
+
+    def invalidate(self, *keys):
+        # no keys drops everything
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+                self._epoch += 1
+                self.invalidations += 1
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "ttl_seconds": self.ttl,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+class CacheInvalidationListener:
+    # Background thread that LISTENs on CACHE_CHANNEL and drops the keys named in each
+    # notification, so several app processes sharing one database stay coherent
+    def __init__(self, engine, cache, channel=CACHE_CHANNEL, poll_interval=5):
+        self.connect_args = engine.url.translate_connect_args(username="user", database="dbname")
+        self.cache = cache
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cache-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.poll_interval + 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.connect_args)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel}")
+                # anything may have changed while we were not listening
+                self.cache.invalidate()
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        keys = [key for key in notify.payload.split(",") if key]
+                        self.cache.invalidate(*keys)
+            except psycopg2.Error:
+                # lost the connection; drop everything and reconnect after a pause
+                self.cache.invalidate()
+                self._stop.wait(self.poll_interval)
+            finally:
+                if conn is not None:
+                    conn.close()
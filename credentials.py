@@ -0,0 +1,168 @@
+# credentials.py
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# scrypt cost parameters (about 16 MB and a few tens of ms per hash)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+HASH_SCHEME = "scrypt"
+
+
+def _b64encode(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password, salt, n, r, p, dklen):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=dklen,
+                          maxmem=256 * n * r)
+
+
+def hash_password(password):
+    # Stored format: scrypt$n$r$p$salt$key (salt and key base64)
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P, KEY_BYTES)
+    return f"{HASH_SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def is_hashed(stored):
+    return bool(stored) and stored.startswith(HASH_SCHEME + "$")
+
+
+def needs_rehash(stored):
+    # legacy plaintext rows and hashes made with older cost parameters are upgraded on login
+    if not is_hashed(stored):
+        return True
+    _, n, r, p, _, _ = stored.split("$")
+    return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def verify_password(password, stored):
+    if not stored:
+        return False
+    if not is_hashed(stored):
+        # row created before hashing was introduced; compared once, then rehashed by the caller
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    try:
+        _, n, r, p, salt, key = stored.split("$")
+        salt = base64.b64decode(salt)
+        key = base64.b64decode(key)
+    except ValueError:
+        return False
+    candidate = _scrypt(password, salt, int(n), int(r), int(p), len(key))
+    return hmac.compare_digest(candidate, key)
+
+
+def _verify_unknown(password, dummy_hash):
+    # same cost as a real check, always fails
+    verify_password(password, dummy_hash)
+    return False
+
+
+class FailedAttemptCache:
+    # Bounded per-identity failure counter. Once an identity has max_failures failures inside
+    # window_seconds it is rejected until the window passes, without running the hash at all.
+    # The oldest identities are evicted first, so memory stays bounded under a spray attack.
+    def __init__(self, max_failures=5, window_seconds=300, max_entries=10000):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def is_locked(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            failures, first_failure = entry
+            if now - first_failure > self.window_seconds:
+                del self._entries[key]
+                return False
+            return failures >= self.max_failures
+
+    def record_failure(self, key):
+        now = time.monotonic()
+        with self._lock:
+            failures, first_failure = self._entries.pop(key, (0, now))
+            if now - first_failure > self.window_seconds:
+                failures, first_failure = 0, now
+            self._entries[key] = (failures + 1, first_failure)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_success(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class CredentialVerifier:
+    # Runs hashing on a small thread pool so callers (the CLI loop today, an async server later)
+    # can hand off the slow work; futures from submit_* can be awaited with asyncio.wrap_future
+    def __init__(self, workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="credentials")
+        self.attempts = FailedAttemptCache()
+        # verified against when an identity does not exist, so the response time does not reveal it
+        self._dummy_hash = None
+
+    def submit_verify(self, password, stored):
+        if stored is None:
+            if self._dummy_hash is None:
+                self._dummy_hash = hash_password(os.urandom(16).hex())
+            return self.executor.submit(_verify_unknown, password, self._dummy_hash)
+        return self.executor.submit(verify_password, password, stored)
+
+    def submit_hash(self, password):
+        return self.executor.submit(hash_password, password)
+
+    def verify(self, password, stored):
+        return self.submit_verify(password, stored).result()
+
+    def hash(self, password):
+        return self.submit_hash(password).result()
+
+    def hash_many(self, passwords):
+        return list(self.executor.map(hash_password, passwords))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class SessionTokens:
+    # Signed session tokens for the JSON service: base64(role:subject:expires).base64(hmac). The
+    # subject is the member or trainer id, or the admin username. Without a configured secret a
+    # random one is used, so tokens only last as long as the process and are not shared with others.
+    def __init__(self, secret="", ttl_seconds=8 * 3600):
+        self.secret = secret.encode("utf-8") if secret else os.urandom(32)
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, payload):
+        return hmac.new(self.secret, payload, hashlib.sha256).digest()
+
+    def issue(self, role, subject):
+        payload = f"{role}:{subject}:{int(time.time()) + self.ttl_seconds}".encode("utf-8")
+        signature = self._sign(payload)
+        return f"{base64.urlsafe_b64encode(payload).decode('ascii')}.{base64.urlsafe_b64encode(signature).decode('ascii')}"
+
+    def verify(self, token):
+        # (role, subject) for a valid unexpired token, otherwise None
+        try:
+            payload, signature = token.split(".")
+            payload = base64.urlsafe_b64decode(payload)
+            signature = base64.urlsafe_b64decode(signature)
+            role, subject, expires = payload.decode("utf-8").rsplit(":", 2)
+            expires = int(expires)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        if not hmac.compare_digest(signature, self._sign(payload)) or expires < time.time():
+            return None
+        return role, subject
@@ -0,0 +1,274 @@
+# datagen.py
+# Deterministic synthetic dataset for load and benchmark runs. Rows are generated from a seeded
+# random.Random and streamed into Postgres with COPY, so the same seed and volumes always
+# produce the same database. Run it against a scratch database only: --reset empties every table.
+#
+#   python datagen.py --reset --members 1000000 --metrics 10000000 --bookings 2000000 --seed 42
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from credentials import hash_password
+from db_manager import DBManager
+from queries import occurrence_window
+
+# every generated member and trainer logs in with this password
+DATAGEN_PASSWORD = "member123"
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+# classes start on the hour from 06:00 to 21:00 and last at most an hour, so slots never overlap
+FIRST_HOUR = 6
+HOURS_PER_DAY = 16
+CLASS_DURATIONS = [30, 45, 50, 60]
+CLASS_NAMES = ["Yoga", "Strength", "Cardio", "Pilates", "HIIT", "Spin", "Boxing", "Barre", "Zumba", "Stretch",
+               "Core", "Rowing", "Mobility", "Kettlebell", "Aqua"]
+FIRST_NAMES = ["Jack", "Ryan", "Ming", "Grant", "Karim", "Ava", "Noah", "Liam", "Emma", "Olivia", "Sofia", "Lucas",
+               "Mia", "Ethan", "Amir", "Chloe", "Mateo", "Priya", "Wei", "Fatima", "Diego", "Hana", "Omar", "Zoe"]
+LAST_NAMES = ["Wimp", "Perry", "Vo", "Tar", "Rifai", "Smith", "Nguyen", "Garcia", "Chen", "Patel", "Kim", "Brown",
+              "Singh", "Lopez", "Martin", "Ali", "Tremblay", "Roy", "Wilson", "Khan", "Santos", "Ito", "Park", "Cohen"]
+GENDERS = ["Male", "Female", "Other"]
+GOALS = ["Lose weight", "Build muscle", "Improve endurance", "Stay active", "Train for a race", "Recover from injury"]
+SPECIALIZATIONS = ["Yoga", "Strength Training", "Cardio", "Pilates", "Rehabilitation", "Boxing"]
+
+DEFAULT_VOLUMES = {
+    "members": 10000,
+    "trainers": 50,
+    "rooms": 20,
+    "classes": 15,
+    "schedules": 1000,
+    "bookings": 20000,
+    "metrics": 100000,
+    "metric_days": 365,
+}
+
+
+class RowStream:
+    # File-like object for copy_expert that renders rows lazily, so volumes larger than memory load
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ""
+        self.count = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            lines = []
+            for row in self.rows:
+                lines.append(",".join("" if value is None else str(value) for value in row))
+                if len(lines) == 1000:
+                    break
+            if not lines:
+                break
+            self.count += len(lines)
+            self.buffer += "\n".join(lines) + "\n"
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+def _copy(cursor, table, columns, rows):
+    stream = RowStream(rows)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", stream)
+    return stream.count
+
+
+def _next_id(cursor, table, column):
+    cursor.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}")
+    return cursor.fetchone()[0] + 1
+
+
+def plan_schedules(volumes, rng, rooms):
+    # picks distinct (room, day, hour) slots; trainer (room + slot) % trainers is distinct across rooms
+    # for a given day and hour, so neither exclusion constraint can be violated
+    usable_rooms = min(len(rooms), volumes["trainers"])
+    slots = usable_rooms * len(DAYS) * HOURS_PER_DAY
+    picked = sorted(rng.sample(range(slots), min(volumes["schedules"], slots)))
+    plan = []
+    for slot in picked:
+        room_index, rest = divmod(slot, len(DAYS) * HOURS_PER_DAY)
+        day_index, hour_index = divmod(rest, HOURS_PER_DAY)
+        trainer_index = (room_index + day_index * HOURS_PER_DAY + hour_index) % volumes["trainers"]
+        plan.append((room_index, day_index, hour_index, trainer_index, rng.randrange(volumes["classes"])))
+    return plan
+
+
+def plan_bookings(volumes, rng, capacities):
+    # bookings per class occurrence, capped by the total number of seats over the horizon
+    total_seats = sum(capacities)
+    target = min(volumes["bookings"], total_seats)
+    fill = target / total_seats if total_seats else 0
+    counts = [int(capacity * fill) for capacity in capacities]
+    open_occurrences = [i for i, capacity in enumerate(capacities) if counts[i] < capacity]
+    while sum(counts) < target and open_occurrences:
+        i = rng.choice(open_occurrences)
+        counts[i] += 1
+        if counts[i] == capacities[i]:
+            open_occurrences.remove(i)
+    return counts
+
+
+def generate(db, volumes=None, seed=42, reset=False):
+    # Loads one dataset and returns {"volumes": rows per table, "seconds": load time per table}
+    volumes = dict(DEFAULT_VOLUMES, **(volumes or {}))
+    if reset:
+        # keeps the schema and empties every table; the dataset replaces the sample data
+        result = db.fast_reset(sample_data=False)
+        if isinstance(result, str):
+            raise RuntimeError(f"Database reset failed: {result}")
+    else:
+        schema = db.ensure_schema()
+        if isinstance(schema, str):
+            raise RuntimeError(f"Database schema check failed: {schema}")
+
+    password = hash_password(DATAGEN_PASSWORD)
+    rng = {table: random.Random(f"{seed}:{table}") for table in
+           ("member", "trainer", "room", "class", "schedule", "booking", "metric")}
+    loaded = {}
+    seconds = {}
+
+    with db.engine.begin() as conn:
+        cursor = conn.connection.cursor()
+        # triggers are off for the load; booked_count is written directly and the
+        # dashboard is rebuilt once at the end
+        for table in ("member", "booking", "health_metric", "class_schedule"):
+            cursor.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+
+        def timed(table, columns, rows):
+            started = time.perf_counter()
+            loaded[table] = _copy(cursor, table, columns, rows)
+            seconds[table] = round(time.perf_counter() - started, 3)
+
+        member_base = _next_id(cursor, "member", "member_id")
+        r = rng["member"]
+        timed("member", ["member_id", "first_name", "last_name", "email", "password", "date_of_birth", "gender", "fitness_goals"], (
+            (member_base + i, r.choice(FIRST_NAMES), r.choice(LAST_NAMES), f"member{member_base + i}@example.com", password,
+             f"{r.randint(1950, 2008)}-{r.randint(1, 12):02d}-{r.randint(1, 28):02d}", r.choice(GENDERS), r.choice(GOALS))
+            for i in range(volumes["members"])
+        ))
+
+        trainer_base = _next_id(cursor, "trainer", "trainer_id")
+        r = rng["trainer"]
+        timed("trainer", ["trainer_id", "first_name", "last_name", "email", "password", "specialization"], (
+            (trainer_base + i, r.choice(FIRST_NAMES), r.choice(LAST_NAMES), f"trainer{trainer_base + i}@example.com",
+             password, r.choice(SPECIALIZATIONS))
+            for i in range(volumes["trainers"])
+        ))
+        timed("trainer_availability", ["trainer_id", "day_of_week", "start_time", "end_time"], (
+            (trainer_base + i, day, f"{FIRST_HOUR:02d}:00", f"{FIRST_HOUR + HOURS_PER_DAY:02d}:00")
+            for i in range(volumes["trainers"]) for day in DAYS
+        ))
+
+        room_base = _next_id(cursor, "room", "room_id")
+        r = rng["room"]
+        capacities = [r.choice([10, 15, 20, 25, 30]) for _ in range(volumes["rooms"])]
+        timed("room", ["room_id", "room_name", "capacity"], (
+            (room_base + i, f"Room {room_base + i}", capacity) for i, capacity in enumerate(capacities)
+        ))
+
+        class_base = _next_id(cursor, "fitness_class", "class_id")
+        r = rng["class"]
+        durations = [r.choice(CLASS_DURATIONS) for _ in range(volumes["classes"])]
+        timed("fitness_class", ["class_id", "name", "description", "duration"], (
+            (class_base + i, f"{CLASS_NAMES[i % len(CLASS_NAMES)]} {i // len(CLASS_NAMES) + 1}",
+             f"Generated class {i + 1}", duration)
+            for i, duration in enumerate(durations)
+        ))
+
+        schedule_base = _next_id(cursor, "class_schedule", "schedule_id")
+        plan = plan_schedules(volumes, rng["schedule"], capacities)
+
+        def schedule_rows():
+            for i, (room, day, hour, trainer, fitness_class) in enumerate(plan):
+                start = FIRST_HOUR + hour
+                end_minutes = start * 60 + durations[fitness_class]
+                yield (schedule_base + i, class_base + fitness_class, room_base + room, trainer_base + trainer,
+                       DAYS[day], f"{start:02d}:00", f"{end_minutes // 60:02d}:{end_minutes % 60:02d}")
+
+        timed("class_schedule", ["schedule_id", "class_id", "room_id", "trainer_id", "day_of_week", "start_time",
+                                 "end_time"], schedule_rows())
+
+        # occurrences over the rolling horizon come from the same function the app uses
+        started = time.perf_counter()
+        start_on, end_on = occurrence_window(db.config["occurrence_horizon_days"])
+        cursor.execute("SELECT ensure_class_occurrences(%s, %s)", (start_on, end_on))
+        loaded["class_occurrence"] = cursor.fetchone()[0]
+        cursor.execute("SELECT occurrence_id, schedule_id FROM class_occurrence WHERE schedule_id >= %s "
+                       "ORDER BY schedule_id, occurrence_date", (schedule_base,))
+        occurrences = cursor.fetchall()
+        seconds["class_occurrence"] = round(time.perf_counter() - started, 3)
+        room_of = {schedule_base + i: room for i, (room, *_) in enumerate(plan)}
+        booked = plan_bookings(volumes, rng["booking"], [capacities[room_of[schedule_id]] for _, schedule_id in occurrences])
+
+        r = rng["booking"]
+        timed("booking", ["member_id", "schedule_id", "occurrence_id"], (
+            (member_base + member, schedule_id, occurrence_id)
+            for (occurrence_id, schedule_id), count in zip(occurrences, booked)
+            for member in r.sample(range(volumes["members"]), min(count, volumes["members"]))
+        ))
+        cursor.execute("""
+            UPDATE class_occurrence o SET booked_count = held.seats
+            FROM (SELECT occurrence_id, COUNT(*) AS seats FROM booking WHERE schedule_id >= %s GROUP BY occurrence_id) held
+            WHERE o.occurrence_id = held.occurrence_id
+        """, (schedule_base,))
+
+        now = datetime.utcnow().replace(microsecond=0)
+        first_metric = now - timedelta(days=volumes["metric_days"])
+        cursor.execute("SELECT ensure_health_metric_partitions(%s, %s)", (first_metric, now))
+        r = rng["metric"]
+        span = volumes["metric_days"] * 86400
+
+        def metric_rows():
+            # each member drifts around a stable baseline derived from its id
+            for _ in range(volumes["metrics"]):
+                member = r.randrange(volumes["members"])
+                yield (member_base + member,
+                       round(120 + member * 7919 % 120 + r.gauss(0, 3), 2),
+                       150 + member * 104729 % 50,
+                       round(10 + member * 31 % 25 + r.gauss(0, 1), 2),
+                       first_metric + timedelta(seconds=r.randrange(span)))
+
+        timed("health_metric", ["member_id", "weight", "height", "bodyfat", "recorded_at"], metric_rows())
+
+        for table, column in (("member", "member_id"), ("trainer", "trainer_id"), ("room", "room_id"),
+                              ("fitness_class", "class_id"), ("class_schedule", "schedule_id")):
+            cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', '{column}'), MAX({column})) FROM {table}")
+        for table in ("member", "booking", "health_metric", "class_schedule"):
+            cursor.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+
+    started = time.perf_counter()
+    db.rebuild_member_dashboard()
+    seconds["member_dashboard"] = round(time.perf_counter() - started, 3)
+    with db.engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("ANALYZE")
+    db.cache.invalidate()
+
+    return {
+        "volumes": loaded,
+        "seconds": seconds,
+        "ids": {"member": (member_base, member_base + volumes["members"] - 1),
+                "trainer": (trainer_base, trainer_base + volumes["trainers"] - 1),
+                "schedule": (schedule_base, schedule_base + len(plan) - 1),
+                "occurrence": (occurrences[0][0], occurrences[-1][0]) if occurrences else (0, -1)},
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic dataset (scratch databases only)")
+    for key, value in DEFAULT_VOLUMES.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, default=value)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="empty all tables first")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = DBManager()
+    volumes = {key: getattr(args, key) for key in DEFAULT_VOLUMES}
+    result = generate(db, volumes, args.seed, args.reset)
+    for table, rows in result["volumes"].items():
+        print(f"{table}: {rows} rows in {result['seconds'][table]}s")
+    print(f"member_dashboard rebuilt in {result['seconds']['member_dashboard']}s")
+    if result["volumes"]["booking"] < volumes["bookings"]:
+        print(f"Bookings capped at {result['volumes']['booking']} (total seats of the generated schedules)")
+    db.close()
@@ -0,0 +1,167 @@
+# export.py
+# Streaming extracts for analytics. Every dataset in queries.EXPORT_DATASETS is written to a file
+# without holding the table in memory: CSV goes through COPY (...) TO STDOUT straight into the
+# file, Parquet is read through a server-side cursor (yield_per) and written one row group per
+# chunk. Each export reads its rows and its cursor, the snapshot's xmin (the oldest transaction
+# still running), in one REPEATABLE READ snapshot. A run writes the rows whose inserting
+# transaction ended between the previous cursor and its own, so a transaction that was open
+# during one run is exported by the next whatever ids it drew. Cursors are kept in
+# export_state.json next to the files.
+#
+#   python export.py --datasets booking_facts,health_metrics --format parquet --out exports
+#   python export.py --full --format csv --gzip --out exports
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import Date, DateTime, Integer, Numeric, Time
+
+import queries
+from db_manager import DBManager, load_db_config
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for --format parquet
+    pa = pq = None
+
+FORMATS = ("csv", "parquet")
+DEFAULT_CHUNK_ROWS = 50000
+COPY_BUFFER_BYTES = 1024 * 1024
+STATE_FILE = "export_state.json"
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(path, state):
+    # written aside and renamed, so a crash never leaves a half written state file
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _arrow_type(sql_type):
+    if isinstance(sql_type, Integer):
+        return pa.int64()
+    if isinstance(sql_type, Numeric):
+        return pa.decimal128(sql_type.precision or 38, sql_type.scale or 0)
+    if isinstance(sql_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, Date):
+        return pa.date32()
+    if isinstance(sql_type, Time):
+        return pa.time64("us")
+    return pa.string()
+
+
+def _write_csv(conn, stmt, path, compress):
+    # the server streams the rows and copy_expert hands them to the file buffer by buffer
+    compiled = stmt.compile(dialect=conn.dialect)
+    cursor = conn.connection.cursor()
+    sql = cursor.mogrify(compiled.string, compiled.params).decode()
+    with (gzip.open(path, "wb") if compress else open(path, "wb")) as out:
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", out, size=COPY_BUFFER_BYTES)
+    return cursor.rowcount
+
+
+def _write_parquet(conn, stmt, path, chunk_rows):
+    # one zstd compressed row group per chunk; the schema comes from the column types, so every
+    # chunk has the same one even when a column is all NULL in it
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pa.schema([(column.name, _arrow_type(column.type)) for column in stmt.selected_columns])
+    rows = 0
+    result = conn.execute(stmt, execution_options={"yield_per": chunk_rows})
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in result.partitions():
+            columns = zip(*chunk)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            rows += len(chunk)
+    return rows
+
+
+def export_dataset(db, dataset, out_dir, fmt="csv", full=False, chunk_rows=DEFAULT_CHUNK_ROWS, compress=False):
+    # Writes the rows of dataset added since its last export (all of them the first time or with
+    # full) and returns {"dataset", "rows", "path", "seconds"}; path is None when there was nothing
+    # new. An updated row is exported again with its new values; deleted rows need a full export.
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    state_path = os.path.join(out_dir, STATE_FILE)
+    state = load_state(state_path)
+    # state from the id watermarks used before has no cursor and restarts with a full export
+    since = None if full else state.get(dataset, {}).get("snapshot_xmin")
+    started = time.perf_counter()
+
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    suffix = ".parquet" if fmt == "parquet" else ".csv.gz" if compress else ".csv"
+    path = os.path.join(out_dir, f"{dataset}-{'full' if since is None else 'incremental'}-{stamp}{suffix}")
+    with db.engine.connect().execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True) as conn:
+        # the first statement takes the snapshot, so the cursor and the rows below come from the same one
+        cursor = conn.execute(queries.export_cursor()).scalar()
+        stmt = queries.export_rows(dataset, since)
+        if conn.execute(stmt.limit(1)).first() is None:
+            rows, path = 0, None
+        else:
+            try:
+                if fmt == "csv":
+                    rows = _write_csv(conn, stmt, path + ".part", compress)
+                else:
+                    rows = _write_parquet(conn, stmt, path + ".part", chunk_rows)
+            except BaseException:
+                if os.path.exists(path + ".part"):
+                    os.remove(path + ".part")
+                raise
+    if path:
+        os.replace(path + ".part", path)
+
+    # saved even when nothing was new, so the next run does not scan the same range again
+    state[dataset] = {"snapshot_xmin": cursor, "rows": rows, "path": path and os.path.basename(path),
+                      "exported_at": datetime.utcnow().isoformat(timespec="seconds")}
+    save_state(state_path, state)
+    return {"dataset": dataset, "rows": rows, "path": path, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stream bookings, schedules and health metrics to files for analytics")
+    parser.add_argument("--datasets", default=",".join(queries.EXPORT_DATASETS),
+                        help=f"comma separated, from {', '.join(queries.EXPORT_DATASETS)}")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--out", default="exports", help="output directory, also holds export_state.json")
+    parser.add_argument("--full", action="store_true", help="export every row and restart the cursors")
+    parser.add_argument("--gzip", action="store_true", help="gzip the CSV files")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows per Parquet row group")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    datasets = [name.strip() for name in args.datasets.split(",") if name.strip()]
+    unknown = [name for name in datasets if name not in queries.EXPORT_DATASETS]
+    if unknown:
+        raise SystemExit(f"Unknown dataset(s): {', '.join(unknown)}")
+
+    config = load_db_config()
+    # this process only reads
+    config["booking_queue"] = False
+    db = DBManager(config)
+    try:
+        for dataset in datasets:
+            result = export_dataset(db, dataset, args.out, args.format, args.full, args.chunk_rows, args.gzip)
+            if result["path"]:
+                print(f"{dataset}: {result['rows']} rows -> {result['path']} ({result['seconds']}s)")
+            else:
+                print(f"{dataset}: nothing new since the last export")
+    finally:
+        db.close()
@@ -0,0 +1,213 @@
+# instrumentation.py
+import functools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+# upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000]
+UNATTRIBUTED = "(outside DBManager)"
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def histogram(samples_ms):
+    counts = {f"<{bound}ms": 0 for bound in HISTOGRAM_BUCKETS_MS}
+    counts[f">={HISTOGRAM_BUCKETS_MS[-1]}ms"] = 0
+    for value in samples_ms:
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if value < bound:
+                counts[f"<{bound}ms"] += 1
+                break
+        else:
+            counts[f">={HISTOGRAM_BUCKETS_MS[-1]}ms"] += 1
+    return counts
+
+
+class _Frame:
+    # counters for one top-level DBManager call on one thread
+    __slots__ = ("method", "statements", "rows", "db_time", "pool_wait_start")
+
+    def __init__(self, method, pool_wait_start):
+        self.method = method
+        self.statements = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.pool_wait_start = pool_wait_start
+
+
+class _MethodStats:
+    def __init__(self, window):
+        self.calls = 0
+        self.statements = 0
+        self.rows = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.total_time = 0.0
+        # rolling window of call durations (ms) for percentiles and the histogram
+        self.recent = deque(maxlen=window)
+
+
+class QueryInstrumentation:
+    # Attributes statement count, rows, DB time and pool wait to the DBManager method that ran them.
+    # Nothing here is installed unless instrumentation is enabled: the engine events are only
+    # listened for, and the methods only wrapped, by DBManager.enable_instrumentation.
+    def __init__(self, engines, slow_query_ms=200, window=1000, slow_log_path=None, max_slow_queries=100):
+        # engines: the primary, then any read replicas (see replicas.py)
+        self.engines = list(engines)
+        self.slow_query_ms = slow_query_ms
+        self.window = window
+        self.slow_log_path = slow_log_path or None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.methods = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self.started_at = datetime.utcnow()
+
+    def install(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        return self
+
+    def uninstall(self):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _pool_wait(self):
+        readers = [getattr(engine.pool, "thread_wait_seconds", None) for engine in self.engines]
+        return sum(reader() for reader in readers if reader)
+
+    def wrap(self, name, method):
+        @functools.wraps(method)
+        def instrumented(*args, **kwargs):
+            local = self._local
+            if getattr(local, "frame", None) is not None:
+                # nested DBManager call, counted as part of the outer one
+                return method(*args, **kwargs)
+            frame = local.frame = _Frame(name, self._pool_wait())
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                local.frame = None
+                self._record(frame, time.perf_counter() - started, self._pool_wait() - frame.pool_wait_start)
+        return instrumented
+
+    def _record(self, frame, elapsed, pool_wait):
+        with self._lock:
+            stats = self.methods.get(frame.method)
+            if stats is None:
+                stats = self.methods[frame.method] = _MethodStats(self.window)
+            stats.calls += 1
+            stats.statements += frame.statements
+            stats.rows += frame.rows
+            stats.db_time += frame.db_time
+            stats.pool_wait += pool_wait
+            stats.total_time += elapsed
+            stats.recent.append(elapsed * 1000)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("instrumentation_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("instrumentation_start")
+        if not stack:
+            # the statement started before instrumentation was enabled (e.g. on a booking worker)
+            return
+        elapsed = time.perf_counter() - stack.pop()
+        frame = getattr(self._local, "frame", None)
+        standalone = frame is None
+        if standalone:
+            # statement run directly on the engine; counted as a call of its own
+            frame = _Frame(UNATTRIBUTED, 0.0)
+        frame.statements += 1
+        frame.db_time += elapsed
+        frame.rows += max(cursor.rowcount, 0)
+        if standalone:
+            self._record(frame, elapsed, 0.0)
+
+        if elapsed * 1000 >= self.slow_query_ms and not executemany:
+            self._log_slow_query(frame.method, cursor, statement, parameters, elapsed)
+
+    def _explain(self, cursor, statement, parameters):
+        # Plain EXPLAIN only: ANALYZE would run the statement a second time, and a SELECT can have
+        # side effects (pg_advisory_lock, FOR UPDATE, ensure_*() and refresh functions, setval).
+        # The measured time is already in the log entry. A savepoint keeps a failing EXPLAIN from
+        # aborting the caller's transaction.
+        body = statement.strip().rstrip(";")
+        keyword = body.split(None, 1)[0].upper() if body else ""
+        if keyword not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE") or ";" in body:
+            return None
+        explain_cursor = cursor.connection.cursor()
+        try:
+            explain_cursor.execute("SAVEPOINT instrumentation_explain")
+            try:
+                explain_cursor.execute(f"EXPLAIN {body}", parameters)
+                plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+                explain_cursor.execute("RELEASE SAVEPOINT instrumentation_explain")
+                return plan
+            except Exception as e:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT instrumentation_explain")
+                return f"EXPLAIN failed: {e}"
+        except Exception as e:
+            # e.g. autocommit connections, where savepoints are not available
+            return f"EXPLAIN unavailable: {e}"
+        finally:
+            explain_cursor.close()
+
+    def _log_slow_query(self, method, cursor, statement, parameters, elapsed):
+        entry = {
+            "at": datetime.utcnow().isoformat(timespec="seconds"),
+            "method": method,
+            "ms": round(elapsed * 1000, 3),
+            "statement": " ".join(statement.split()),
+            "parameters": repr(parameters)[:500],
+            "plan": self._explain(cursor, statement, parameters),
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+            if self.slow_log_path:
+                with open(self.slow_log_path, "a", encoding="utf-8") as f:
+                    f.write(f"[{entry['at']}] {entry['method']} {entry['ms']} ms\n{entry['statement']}\n"
+                            f"parameters: {entry['parameters']}\n{entry['plan'] or '(no plan)'}\n\n")
+
+    def report(self):
+        with self._lock:
+            methods = {}
+            for name, stats in sorted(self.methods.items(), key=lambda item: -item[1].total_time):
+                recent = sorted(stats.recent)
+                methods[name] = {
+                    "calls": stats.calls,
+                    "statements": stats.statements,
+                    "statements_per_call": round(stats.statements / stats.calls, 2),
+                    "rows": stats.rows,
+                    "db_ms": round(stats.db_time * 1000, 3),
+                    "pool_wait_ms": round(stats.pool_wait * 1000, 3),
+                    "total_ms": round(stats.total_time * 1000, 3),
+                    "p50_ms": round(_percentile(recent, 0.50), 3),
+                    "p95_ms": round(_percentile(recent, 0.95), 3),
+                    "p99_ms": round(_percentile(recent, 0.99), 3),
+                    "histogram": histogram(recent),
+                }
+            return {
+                "since": self.started_at.isoformat(timespec="seconds"),
+                "slow_query_ms": self.slow_query_ms,
+                "window": self.window,
+                "methods": methods,
+                "slow_queries": list(self.slow_queries),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.methods.clear()
+            self.slow_queries.clear()
+            self.started_at = datetime.utcnow()
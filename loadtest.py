@@ -0,0 +1,174 @@
+# loadtest.py
+# Load test for the JSON service (python app.py --serve). Each client thread holds one
+# keep-alive connection and loops over a weighted mix of endpoints; the report gives
+# requests per second and p50/p99 latency per endpoint. Each client logs in once as the sample
+# member and trainer and sends the session tokens with the member and trainer routes.
+#
+#   python loadtest.py --clients 200 --duration 30
+#   python loadtest.py --writes --json report.json
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+
+# (label, method, path, body, weight, role); {occurrence_id} is filled in per request and the
+# role's session token is sent, None for public routes
+READ_MIX = [
+    ("GET /classes/available", "GET", "/classes/available?only_available=true&limit=10", None, 5, "member"),
+    ("GET /members/me/profile", "GET", "/members/me/profile", None, 3, "member"),
+    ("GET /members/me/bookings", "GET", "/members/me/bookings", None, 3, "member"),
+    ("GET /trainers/me/schedule", "GET", "/trainers/me/schedule", None, 2, "trainer"),
+    ("GET /schedules", "GET", "/schedules", None, 2, "member"),
+    ("GET /rooms", "GET", "/rooms", None, 1, "member"),
+    ("POST /members/login", "POST", "/members/login", {"email": "jack@gmail.com", "password": "123"}, 1, None),
+]
+WRITE_MIX = [
+    ("POST /bookings", "POST", "/bookings", {"occurrence_id": "{occurrence_id}"}, 2, "member"),
+]
+LOGINS = {
+    "member": ("/members/login", {"email": "jack@gmail.com", "password": "123"}),
+    "trainer": ("/trainers/login", {"email": "grant@gmail.com", "password": "123"}),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def fill(value, ids):
+    if isinstance(value, str):
+        return value.format(**ids)
+    if isinstance(value, dict):
+        return {key: fill(item, ids) for key, item in value.items()}
+    return value
+
+
+class Client(threading.Thread):
+    def __init__(self, args, mix, deadline, results):
+        super().__init__(daemon=True)
+        self.args = args
+        self.mix = mix
+        self.weights = [entry[4] for entry in mix]
+        self.deadline = deadline
+        self.results = results
+        self.random = random.Random()
+
+    def connect(self):
+        return http.client.HTTPConnection(self.args.host, self.args.port, timeout=self.args.timeout)
+
+    def login(self, conn):
+        tokens = {}
+        for role, (path, body) in LOGINS.items():
+            conn.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            data = json.loads(response.read())
+            if response.status != 200:
+                raise RuntimeError(f"{role} login failed: {data.get('error')}")
+            tokens[role] = data["token"]
+        return tokens
+
+    def run(self):
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        conn = self.connect()
+        tokens = self.login(conn)
+        while time.monotonic() < self.deadline:
+            label, method, path, body, _, role = self.random.choices(self.mix, self.weights)[0]
+            ids = {"occurrence_id": self.random.randint(1, self.args.occurrences)}
+            payload = json.dumps(fill(body, ids)) if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload is not None else {}
+            if role:
+                headers["Authorization"] = f"Bearer {tokens[role]}"
+            started = time.perf_counter()
+            try:
+                conn.request(method, fill(path, ids), body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                elapsed = time.perf_counter() - started
+                latencies[label].append(elapsed)
+                # 4xx like "class full" are valid answers; only server-side failures count as errors
+                if response.status >= 500:
+                    errors[label] += 1
+                if response.getheader("Connection", "").lower() == "close":
+                    conn.close()
+                    conn = self.connect()
+            except (OSError, http.client.HTTPException):
+                errors[label] += 1
+                conn.close()
+                conn = self.connect()
+        conn.close()
+        self.results.append((latencies, errors))
+
+
+def run(args):
+    mix = READ_MIX + (WRITE_MIX if args.writes else [])
+    deadline = time.monotonic() + args.duration
+    results = []
+    clients = [Client(args, mix, deadline, results) for _ in range(args.clients)]
+    started = time.monotonic()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    wall = time.monotonic() - started
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for client_latencies, client_errors in results:
+        for label, values in client_latencies.items():
+            latencies[label].extend(values)
+        for label, count in client_errors.items():
+            errors[label] += count
+
+    report = {"clients": args.clients, "duration_seconds": round(wall, 2), "endpoints": {}}
+    total = 0
+    for label, *_ in mix:
+        values = sorted(latencies[label])
+        total += len(values)
+        report["endpoints"][label] = {
+            "requests": len(values),
+            "errors": errors[label],
+            "rps": round(len(values) / wall, 1),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        }
+    report["total_requests"] = total
+    report["total_rps"] = round(total / wall, 1)
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['clients']} clients, {report['duration_seconds']}s")
+    print(f"{'Endpoint':<32}{'Requests':>10}{'Errors':>8}{'RPS':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, stats in report["endpoints"].items():
+        print(f"{label:<32}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"{'Total':<32}{report['total_requests']:>10}{'':>8}{report['total_rps']:>10}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the fitness club JSON service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=100, help="concurrent keep-alive connections")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--timeout", type=float, default=15.0, help="client socket timeout in seconds")
+    parser.add_argument("--occurrences", type=int, default=4, help="class occurrence ids are drawn from 1..N")
+    parser.add_argument("--writes", action="store_true", help="include booking inserts in the mix")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = run(args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,753 @@
+# migrations.py
+# Ordered schema migrations. Each step runs once, in its own transaction, and is recorded in
+# schema_version with a checksum of its definition, so DBManager.ensure_schema can tell with one
+# query that a database is current and skip all DDL. Never edit an applied step: append a new one.
+# Every step is also safe to run against a database that already has its objects, which is how
+# databases created before schema_version existed are brought under version control.
+import hashlib
+
+from sqlalchemy import text
+
+from models import Base, HealthMetric
+
+# pg_advisory_lock key serializing concurrent bootstraps of the same database
+MIGRATION_LOCK_KEY = 3005001
+
+# btree_gist lets the exclusion constraints mix = on room/trainer/day with && on the time range
+RANGE_TYPES_SQL = """
+    CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+    DO $$
+    BEGIN
+        CREATE TYPE timerange AS RANGE (subtype = time);
+    EXCEPTION
+        WHEN duplicate_object THEN NULL;
+    END
+    $$;
+"""
+
+# Capacity is reserved with one conditional UPDATE on class_schedule.booked_count per
+# INSERT statement. The row lock taken by the UPDATE serializes concurrent bookings for
+# the same schedule, so two inserts can no longer both pass the check and overbook.
+CAPACITY_TRIGGERS_SQL = """
+    CREATE OR REPLACE FUNCTION check_class_capacity()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        requested INT;
+        reserved INT;
+    BEGIN
+        WITH added AS (
+            SELECT schedule_id, COUNT(*) AS seats
+            FROM new_bookings
+            GROUP BY schedule_id
+        ), updated AS (
+            UPDATE class_schedule cs
+            SET booked_count = cs.booked_count + added.seats
+            FROM added, room r
+            WHERE cs.schedule_id = added.schedule_id
+              AND r.room_id = cs.room_id
+              AND cs.booked_count + added.seats <= r.capacity
+            RETURNING cs.schedule_id
+        )
+        SELECT (SELECT COUNT(*) FROM added), (SELECT COUNT(*) FROM updated)
+        INTO requested, reserved;
+
+        IF reserved < requested THEN
+            RAISE EXCEPTION 'Class is at full capacity';
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION release_class_capacity()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE class_schedule cs
+        SET booked_count = cs.booked_count - removed.seats
+        FROM (
+            SELECT schedule_id, COUNT(*) AS seats
+            FROM old_bookings
+            GROUP BY schedule_id
+        ) removed
+        WHERE cs.schedule_id = removed.schedule_id;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS enforce_capacity ON booking;
+    CREATE TRIGGER enforce_capacity
+    AFTER INSERT ON booking
+    REFERENCING NEW TABLE AS new_bookings
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION check_class_capacity();
+
+    DROP TRIGGER IF EXISTS release_capacity ON booking;
+    CREATE TRIGGER release_capacity
+    AFTER DELETE ON booking
+    REFERENCING OLD TABLE AS old_bookings
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION release_class_capacity();
+"""
+
+# member_dashboard holds one row per member (latest metric, metric count, booking count).
+# Statement-level triggers apply each insert/delete as a grouped delta, so a dashboard
+# read is a primary key lookup and bulk writes cost one trigger call per statement.
+DASHBOARD_SQL = """
+    DROP VIEW IF EXISTS member_dashboard_view;
+
+    CREATE OR REPLACE FUNCTION dashboard_add_members()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        INSERT INTO member_dashboard (member_id)
+        SELECT member_id FROM new_members
+        ON CONFLICT (member_id) DO NOTHING;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_add_metrics()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        INSERT INTO member_dashboard AS d
+            (member_id, latest_metric_id, weight, height, bodyfat, recorded_at, metric_count)
+        SELECT latest.member_id, latest.metric_id, latest.weight, latest.height,
+               latest.bodyfat, latest.recorded_at, added.metrics
+        FROM (
+            SELECT DISTINCT ON (member_id) *
+            FROM new_metrics
+            ORDER BY member_id, recorded_at DESC, metric_id DESC
+        ) latest
+        JOIN (
+            SELECT member_id, COUNT(*) AS metrics
+            FROM new_metrics
+            GROUP BY member_id
+        ) added ON added.member_id = latest.member_id
+        ON CONFLICT (member_id) DO UPDATE SET
+            metric_count = d.metric_count + EXCLUDED.metric_count,
+            latest_metric_id = CASE WHEN d.recorded_at IS NULL OR EXCLUDED.recorded_at >= d.recorded_at
+                                    THEN EXCLUDED.latest_metric_id ELSE d.latest_metric_id END,
+            weight = CASE WHEN d.recorded_at IS NULL OR EXCLUDED.recorded_at >= d.recorded_at
+                          THEN EXCLUDED.weight ELSE d.weight END,
+            height = CASE WHEN d.recorded_at IS NULL OR EXCLUDED.recorded_at >= d.recorded_at
+                          THEN EXCLUDED.height ELSE d.height END,
+            bodyfat = CASE WHEN d.recorded_at IS NULL OR EXCLUDED.recorded_at >= d.recorded_at
+                           THEN EXCLUDED.bodyfat ELSE d.bodyfat END,
+            recorded_at = GREATEST(d.recorded_at, EXCLUDED.recorded_at);
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_remove_metrics()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        -- the latest metric may be gone, so recompute only the affected members
+        UPDATE member_dashboard d
+        SET metric_count = (SELECT COUNT(*) FROM health_metric hm WHERE hm.member_id = d.member_id),
+            latest_metric_id = latest.metric_id,
+            weight = latest.weight,
+            height = latest.height,
+            bodyfat = latest.bodyfat,
+            recorded_at = latest.recorded_at
+        FROM (SELECT DISTINCT member_id FROM old_metrics) affected
+        LEFT JOIN LATERAL (
+            SELECT hm.metric_id, hm.weight, hm.height, hm.bodyfat, hm.recorded_at
+            FROM health_metric hm
+            WHERE hm.member_id = affected.member_id
+            ORDER BY hm.recorded_at DESC, hm.metric_id DESC
+            LIMIT 1
+        ) latest ON TRUE
+        WHERE d.member_id = affected.member_id;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_add_bookings()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE member_dashboard d
+        SET total_bookings = d.total_bookings + added.bookings
+        FROM (
+            SELECT member_id, COUNT(*) AS bookings
+            FROM new_bookings
+            GROUP BY member_id
+        ) added
+        WHERE d.member_id = added.member_id;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION dashboard_remove_bookings()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE member_dashboard d
+        SET total_bookings = d.total_bookings - removed.bookings
+        FROM (
+            SELECT member_id, COUNT(*) AS bookings
+            FROM old_bookings
+            GROUP BY member_id
+        ) removed
+        WHERE d.member_id = removed.member_id;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS dashboard_member_insert ON member;
+    CREATE TRIGGER dashboard_member_insert
+    AFTER INSERT ON member
+    REFERENCING NEW TABLE AS new_members
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dashboard_add_members();
+
+    DROP TRIGGER IF EXISTS dashboard_metric_insert ON health_metric;
+    CREATE TRIGGER dashboard_metric_insert
+    AFTER INSERT ON health_metric
+    REFERENCING NEW TABLE AS new_metrics
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dashboard_add_metrics();
+
+    DROP TRIGGER IF EXISTS dashboard_metric_delete ON health_metric;
+    CREATE TRIGGER dashboard_metric_delete
+    AFTER DELETE ON health_metric
+    REFERENCING OLD TABLE AS old_metrics
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dashboard_remove_metrics();
+
+    DROP TRIGGER IF EXISTS dashboard_booking_insert ON booking;
+    CREATE TRIGGER dashboard_booking_insert
+    AFTER INSERT ON booking
+    REFERENCING NEW TABLE AS new_bookings
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dashboard_add_bookings();
+
+    DROP TRIGGER IF EXISTS dashboard_booking_delete ON booking;
+    CREATE TRIGGER dashboard_booking_delete
+    AFTER DELETE ON booking
+    REFERENCING OLD TABLE AS old_bookings
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dashboard_remove_bookings();
+"""
+
+# email for logins, booking lookups by member and schedule, and the trigram indexes for the
+# trainer member search (the name expression must match queries.MEMBER_FULL_NAME)
+INDEXES_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_member_email 
+    ON member(email);
+
+    CREATE INDEX IF NOT EXISTS idx_booking_member 
+    ON booking(member_id);
+
+    CREATE INDEX IF NOT EXISTS idx_booking_schedule 
+    ON booking(schedule_id);
+
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+    CREATE INDEX IF NOT EXISTS idx_member_name_trgm
+    ON member USING gin ((first_name || ' ' || last_name) gin_trgm_ops);
+
+    CREATE INDEX IF NOT EXISTS idx_member_email_trgm
+    ON member USING gin (email gin_trgm_ops);
+"""
+
+# Creates the missing monthly partitions of health_metric between two timestamps. Rows that
+# landed in the default partition for a new month are moved into it before it is attached.
+HEALTH_METRIC_PARTITION_FUNCTION = """
+    CREATE OR REPLACE FUNCTION ensure_health_metric_partitions(start_at timestamp, end_at timestamp)
+    RETURNS integer AS $$
+    DECLARE
+        month_start timestamp := date_trunc('month', start_at);
+        month_end timestamp;
+        part_name text;
+        created integer := 0;
+    BEGIN
+        CREATE TABLE IF NOT EXISTS health_metric_default PARTITION OF health_metric DEFAULT;
+        WHILE month_start <= end_at LOOP
+            month_end := month_start + interval '1 month';
+            part_name := format('health_metric_p%s', to_char(month_start, 'YYYY_MM'));
+            IF to_regclass(part_name) IS NULL THEN
+                EXECUTE format('CREATE TABLE %I (LIKE health_metric INCLUDING DEFAULTS)', part_name);
+                EXECUTE format(
+                    'WITH moved AS (DELETE FROM health_metric_default WHERE recorded_at >= %L AND recorded_at < %L RETURNING *)
+                     INSERT INTO %I SELECT * FROM moved', month_start, month_end, part_name);
+                EXECUTE format('ALTER TABLE health_metric ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                               part_name, month_start, month_end);
+                created := created + 1;
+            END IF;
+            month_start := month_end;
+        END LOOP;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+# Materializes the dated occurrences of the weekly schedules (or of one schedule) between two
+# dates. Existing occurrences are left alone, so it is safe to call as often as needed.
+OCCURRENCE_FUNCTION = """
+    CREATE OR REPLACE FUNCTION ensure_class_occurrences(start_on date, end_on date, only_schedule integer DEFAULT NULL)
+    RETURNS integer AS $$
+    DECLARE
+        created integer;
+    BEGIN
+        INSERT INTO class_occurrence (schedule_id, occurrence_date)
+        SELECT cs.schedule_id, day::date
+        FROM generate_series(start_on::timestamp, end_on::timestamp, interval '1 day') AS day
+        JOIN class_schedule cs ON lower(cs.day_of_week) = lower(to_char(day, 'FMDay'))
+        WHERE only_schedule IS NULL OR cs.schedule_id = only_schedule
+        ORDER BY day, cs.schedule_id
+        ON CONFLICT (occurrence_date, schedule_id) DO NOTHING;
+        GET DIAGNOSTICS created = ROW_COUNT;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# Same reservation as CAPACITY_TRIGGERS_SQL, but seats are counted per dated occurrence, so a
+# booking holds one seat on one day instead of one on every future week
+OCCURRENCE_CAPACITY_SQL = """
+    CREATE OR REPLACE FUNCTION check_class_capacity()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        requested INT;
+        reserved INT;
+    BEGIN
+        WITH added AS (
+            SELECT occurrence_id, COUNT(*) AS seats
+            FROM new_bookings
+            GROUP BY occurrence_id
+        ), updated AS (
+            UPDATE class_occurrence o
+            SET booked_count = o.booked_count + added.seats
+            FROM added, class_schedule cs, room r
+            WHERE o.occurrence_id = added.occurrence_id
+              AND cs.schedule_id = o.schedule_id
+              AND r.room_id = cs.room_id
+              AND o.booked_count + added.seats <= r.capacity
+            RETURNING o.occurrence_id
+        )
+        SELECT (SELECT COUNT(*) FROM added), (SELECT COUNT(*) FROM updated)
+        INTO requested, reserved;
+
+        IF reserved < requested THEN
+            RAISE EXCEPTION 'Class is at full capacity';
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION release_class_capacity()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        UPDATE class_occurrence o
+        SET booked_count = o.booked_count - removed.seats
+        FROM (
+            SELECT occurrence_id, COUNT(*) AS seats
+            FROM old_bookings
+            GROUP BY occurrence_id
+        ) removed
+        WHERE o.occurrence_id = removed.occurrence_id;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# Adds the class occurrences dated after report_refresh.refreshed_through and up to through to
+# the report rollups, as grouped deltas, and returns how many occurrences were added. Callers pass
+# yesterday at the latest, since a day's seat counts are final once it is over. The report_refresh
+# row lock serializes concurrent refreshes, so no day is counted twice.
+REPORT_ROLLUP_FUNCTION = """
+    CREATE OR REPLACE FUNCTION refresh_report_rollups(through date)
+    RETURNS integer AS $$
+    DECLARE
+        done_through date;
+        first_day date;
+        added integer;
+    BEGIN
+        INSERT INTO report_refresh (source) VALUES ('class_occurrence') ON CONFLICT (source) DO NOTHING;
+        SELECT refreshed_through INTO done_through FROM report_refresh WHERE source = 'class_occurrence' FOR UPDATE;
+        done_through := COALESCE(done_through, '-infinity'::date);
+        IF through <= done_through THEN
+            RETURN 0;
+        END IF;
+
+        SELECT COUNT(*), MIN(occurrence_date) INTO added, first_day
+        FROM class_occurrence
+        WHERE occurrence_date > done_through AND occurrence_date <= through;
+
+        -- a class is split over the hours of the day it overlaps, e.g. 09:30-11:00 counts 30
+        -- minutes at 9 and 60 at 10
+        INSERT INTO room_usage_rollup AS u
+            (room_id, day_of_week, hour, occurrences, used_minutes, booked_seats, seat_capacity)
+        SELECT cs.room_id, to_char(o.occurrence_date, 'FMDay'), h.hour, COUNT(*),
+               round(SUM(LEAST(extract(epoch FROM cs.end_time), (h.hour + 1) * 3600)
+                         - GREATEST(extract(epoch FROM cs.start_time), h.hour * 3600)) / 60),
+               SUM(o.booked_count), SUM(r.capacity)
+        FROM class_occurrence o
+        JOIN class_schedule cs ON cs.schedule_id = o.schedule_id
+        JOIN room r ON r.room_id = cs.room_id
+        CROSS JOIN LATERAL generate_series(extract(hour FROM cs.start_time)::integer,
+                                           ceil(extract(epoch FROM cs.end_time) / 3600)::integer - 1) AS h(hour)
+        WHERE o.occurrence_date > done_through AND o.occurrence_date <= through
+        GROUP BY cs.room_id, to_char(o.occurrence_date, 'FMDay'), h.hour
+        ON CONFLICT (room_id, day_of_week, hour) DO UPDATE SET
+            occurrences = u.occurrences + EXCLUDED.occurrences,
+            used_minutes = u.used_minutes + EXCLUDED.used_minutes,
+            booked_seats = u.booked_seats + EXCLUDED.booked_seats,
+            seat_capacity = u.seat_capacity + EXCLUDED.seat_capacity;
+
+        INSERT INTO trainer_load_rollup AS t (trainer_id, week_start, classes, taught_minutes, booked_seats)
+        SELECT cs.trainer_id, date_trunc('week', o.occurrence_date)::date, COUNT(*),
+               round(SUM(extract(epoch FROM cs.end_time - cs.start_time)) / 60), SUM(o.booked_count)
+        FROM class_occurrence o
+        JOIN class_schedule cs ON cs.schedule_id = o.schedule_id
+        WHERE o.occurrence_date > done_through AND o.occurrence_date <= through
+        GROUP BY cs.trainer_id, date_trunc('week', o.occurrence_date)::date
+        ON CONFLICT (trainer_id, week_start) DO UPDATE SET
+            classes = t.classes + EXCLUDED.classes,
+            taught_minutes = t.taught_minutes + EXCLUDED.taught_minutes,
+            booked_seats = t.booked_seats + EXCLUDED.booked_seats;
+
+        INSERT INTO class_fill_rollup AS f (class_id, week_start, occurrences, booked_seats, seat_capacity)
+        SELECT cs.class_id, date_trunc('week', o.occurrence_date)::date, COUNT(*),
+               SUM(o.booked_count), SUM(r.capacity)
+        FROM class_occurrence o
+        JOIN class_schedule cs ON cs.schedule_id = o.schedule_id
+        JOIN room r ON r.room_id = cs.room_id
+        WHERE o.occurrence_date > done_through AND o.occurrence_date <= through
+        GROUP BY cs.class_id, date_trunc('week', o.occurrence_date)::date
+        ON CONFLICT (class_id, week_start) DO UPDATE SET
+            occurrences = f.occurrences + EXCLUDED.occurrences,
+            booked_seats = f.booked_seats + EXCLUDED.booked_seats,
+            seat_capacity = f.seat_capacity + EXCLUDED.seat_capacity;
+
+        UPDATE report_refresh
+        SET covered_from = COALESCE(covered_from, first_day),
+            refreshed_through = through,
+            refreshed_at = now() AT TIME ZONE 'utc'
+        WHERE source = 'class_occurrence';
+        RETURN added;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+# Databases from before schema_version got their tables from create_all, which never adds
+# columns or constraints to a table that already exists. This gives legacy class_schedule and
+# trainer_availability rows the time_slot ranges, checks, GiST index and exclusion constraints
+# that models.py declares; on a database that has them already it changes nothing.
+SCHEDULE_RANGES_SQL = """
+    ALTER TABLE class_schedule ADD COLUMN IF NOT EXISTS time_slot timerange
+        GENERATED ALWAYS AS (timerange(start_time, end_time)) STORED;
+    ALTER TABLE trainer_availability ADD COLUMN IF NOT EXISTS time_slot timerange
+        GENERATED ALWAYS AS (timerange(start_time, end_time)) STORED;
+
+    CREATE INDEX IF NOT EXISTS idx_availability_slot
+    ON trainer_availability USING gist (trainer_id, day_of_week, time_slot);
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'class_schedule'::regclass
+                       AND conname = 'schedule_valid_times') THEN
+            ALTER TABLE class_schedule ADD CONSTRAINT schedule_valid_times CHECK (start_time < end_time);
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'trainer_availability'::regclass
+                       AND conname = 'availability_valid_times') THEN
+            ALTER TABLE trainer_availability ADD CONSTRAINT availability_valid_times CHECK (start_time < end_time);
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'class_schedule'::regclass
+                       AND conname = 'no_room_overlap') THEN
+            ALTER TABLE class_schedule ADD CONSTRAINT no_room_overlap
+                EXCLUDE USING gist (room_id WITH =, day_of_week WITH =, time_slot WITH &&);
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'class_schedule'::regclass
+                       AND conname = 'no_trainer_overlap') THEN
+            ALTER TABLE class_schedule ADD CONSTRAINT no_trainer_overlap
+                EXCLUDE USING gist (trainer_id WITH =, day_of_week WITH =, time_slot WITH &&);
+        END IF;
+    END
+    $$;
+"""
+
+# Migration 10: recomputes every member's dashboard row from health_metric and booking, for
+# members that existed before its triggers. Frozen; DBManager.rebuild_member_dashboard runs its own
+# copy (queries.REBUILD_DASHBOARD_SQL). SHARE ROW EXCLUSIVE lets dashboard reads continue but makes
+# the triggers wait, so no delta is lost between the snapshot and the upsert.
+DASHBOARD_BACKFILL_SQL = """
+    LOCK TABLE member_dashboard IN SHARE ROW EXCLUSIVE MODE;
+
+    INSERT INTO member_dashboard AS d
+        (member_id, latest_metric_id, weight, height, bodyfat, recorded_at,
+         metric_count, total_bookings)
+    SELECT m.member_id, latest.metric_id, latest.weight, latest.height,
+           latest.bodyfat, latest.recorded_at,
+           COALESCE(metrics.metric_count, 0), COALESCE(bookings.total_bookings, 0)
+    FROM member m
+    LEFT JOIN (
+        SELECT DISTINCT ON (member_id) member_id, metric_id, weight, height, bodyfat, recorded_at
+        FROM health_metric
+        ORDER BY member_id, recorded_at DESC, metric_id DESC
+    ) latest ON latest.member_id = m.member_id
+    LEFT JOIN (
+        SELECT member_id, COUNT(*) AS metric_count FROM health_metric GROUP BY member_id
+    ) metrics ON metrics.member_id = m.member_id
+    LEFT JOIN (
+        SELECT member_id, COUNT(*) AS total_bookings FROM booking GROUP BY member_id
+    ) bookings ON bookings.member_id = m.member_id
+    ON CONFLICT (member_id) DO UPDATE SET
+        latest_metric_id = EXCLUDED.latest_metric_id,
+        weight = EXCLUDED.weight,
+        height = EXCLUDED.height,
+        bodyfat = EXCLUDED.bodyfat,
+        recorded_at = EXCLUDED.recorded_at,
+        metric_count = EXCLUDED.metric_count,
+        total_bookings = EXCLUDED.total_bookings;
+"""
+
+# a legacy row's schedule -> that schedule's next occurrence from today on
+_NEXT_OCCURRENCE_SQL = """(
+    SELECT o.occurrence_id FROM class_occurrence o
+    WHERE o.schedule_id = {table}.schedule_id AND o.occurrence_date >= current_date
+    ORDER BY o.occurrence_date
+    LIMIT 1
+)"""
+
+def _numeric_sql(column):
+    # legacy text metric -> numeric, NULL when the text is not a number
+    return f"CASE WHEN trim({column}) ~ '^[-+]?[0-9]*[.]?[0-9]+$' THEN round(trim({column})::numeric, 2) END"
+
+
+# Steps 6 and 7 decide at run time what a database needs, so they are functions; every statement
+# they can run is one of the constants below, and their Migration lists them for the checksum.
+
+LEGACY_HEALTH_METRIC_KIND_SQL = "SELECT relkind FROM pg_class WHERE oid = to_regclass('health_metric')"
+
+# the dashboard triggers go with the legacy table and are recreated on the new one
+LEGACY_HEALTH_METRIC_RENAME_SQL = """
+    LOCK TABLE health_metric, member_dashboard IN ACCESS EXCLUSIVE MODE;
+
+    ALTER TABLE health_metric RENAME TO health_metric_legacy;
+    ALTER INDEX health_metric_pkey RENAME TO health_metric_legacy_pkey;
+    ALTER SEQUENCE health_metric_metric_id_seq RENAME TO health_metric_legacy_metric_id_seq;
+"""
+
+LEGACY_HEALTH_METRIC_PARTITIONS_SQL = """
+    SELECT ensure_health_metric_partitions(
+        COALESCE(MIN(recorded_at), now() AT TIME ZONE 'utc'),
+        COALESCE(MAX(recorded_at), now() AT TIME ZONE 'utc')
+    ) FROM health_metric_legacy
+"""
+
+LEGACY_HEALTH_METRIC_COPY_SQL = f"""
+    INSERT INTO health_metric (metric_id, member_id, weight, height, bodyfat, recorded_at)
+    SELECT metric_id, member_id, {_numeric_sql("weight")}, {_numeric_sql("height")},
+           {_numeric_sql("bodyfat")}, recorded_at
+    FROM health_metric_legacy
+"""
+
+LEGACY_DASHBOARD_TYPE_SQL = """
+    SELECT data_type FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'member_dashboard' AND column_name = 'weight'
+"""
+
+LEGACY_DASHBOARD_NUMERIC_SQL = f"""
+    ALTER TABLE member_dashboard
+        ALTER COLUMN weight TYPE numeric(6, 2) USING {_numeric_sql("weight")},
+        ALTER COLUMN height TYPE numeric(6, 2) USING {_numeric_sql("height")},
+        ALTER COLUMN bodyfat TYPE numeric(5, 2) USING {_numeric_sql("bodyfat")};
+"""
+
+LEGACY_HEALTH_METRIC_FINISH_SQL = """
+    SELECT setval('health_metric_metric_id_seq', COALESCE(MAX(metric_id), 0) + 1, false) FROM health_metric;
+    DROP TABLE health_metric_legacy;
+
+    CREATE TRIGGER dashboard_metric_insert
+    AFTER INSERT ON health_metric
+    REFERENCING NEW TABLE AS new_metrics
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dashboard_add_metrics();
+
+    CREATE TRIGGER dashboard_metric_delete
+    AFTER DELETE ON health_metric
+    REFERENCING OLD TABLE AS old_metrics
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION dashboard_remove_metrics();
+"""
+
+# last month through three months ahead; Maintenance rolls the window forward
+HEALTH_METRIC_WINDOW_SQL = """
+    SELECT ensure_health_metric_partitions(
+        date_trunc('month', now() AT TIME ZONE 'utc') - interval '1 month',
+        now() AT TIME ZONE 'utc' + interval '3 months'
+    )
+"""
+
+OCCURRENCE_COLUMNS_SQL = """
+    ALTER TABLE booking ADD COLUMN IF NOT EXISTS occurrence_id integer
+        REFERENCES class_occurrence (occurrence_id) ON DELETE CASCADE;
+    ALTER TABLE booking_request ADD COLUMN IF NOT EXISTS occurrence_id integer
+        REFERENCES class_occurrence (occurrence_id) ON DELETE CASCADE;
+
+    -- one week is enough for every schedule to have a next occurrence
+    SELECT ensure_class_occurrences(current_date, current_date + 6);
+"""
+
+OCCURRENCE_BOOKINGS_SQL = f"""
+    UPDATE booking b SET occurrence_id = {_NEXT_OCCURRENCE_SQL.format(table="b")}
+    WHERE b.occurrence_id IS NULL;
+    -- only schedules whose day_of_week is not a weekday name have no occurrence
+    DELETE FROM booking WHERE occurrence_id IS NULL;
+    ALTER TABLE booking ALTER COLUMN occurrence_id SET NOT NULL;
+
+    UPDATE class_occurrence o
+    SET booked_count = held.seats
+    FROM (SELECT occurrence_id, COUNT(*) AS seats FROM booking GROUP BY occurrence_id) held
+    WHERE o.occurrence_id = held.occurrence_id;
+"""
+
+LEGACY_REQUESTS_CHECK_SQL = """
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema() AND table_name = 'booking_request' AND column_name = 'schedule_id'
+"""
+
+# dropping schedule_id also drops the old idx_booking_request_open
+LEGACY_REQUESTS_SQL = f"""
+    UPDATE booking_request r SET occurrence_id = {_NEXT_OCCURRENCE_SQL.format(table="r")}
+    WHERE r.occurrence_id IS NULL;
+    DELETE FROM booking_request WHERE occurrence_id IS NULL;
+    ALTER TABLE booking_request DROP COLUMN schedule_id;
+"""
+
+OCCURRENCE_INDEXES_SQL = """
+    ALTER TABLE booking_request ALTER COLUMN occurrence_id SET NOT NULL;
+    CREATE INDEX IF NOT EXISTS idx_booking_request_open
+    ON booking_request (occurrence_id, request_id) WHERE status IN ('pending', 'waitlisted');
+
+    CREATE INDEX IF NOT EXISTS idx_booking_occurrence
+    ON booking(occurrence_id);
+
+    ALTER TABLE class_schedule DROP COLUMN IF EXISTS booked_count;
+"""
+
+# everything before today, so the first report does not pay for the history
+REPORT_ROLLUP_BACKFILL_SQL = "SELECT refresh_report_rollups(current_date - 1)"
+
+# The tables step 2 creates from models.py, checkfirst, so only tables missing from an existing
+# database are created. Frozen: a model added later gets its own step, and a column added to one
+# of these tables takes an ADD COLUMN IF NOT EXISTS step, as step 7 does for booking.
+INITIAL_TABLES = (
+    "admin", "fitness_class", "member", "report_refresh", "room", "schema_version", "trainer",
+    "class_fill_rollup", "class_schedule", "health_metric", "member_dashboard", "room_usage_rollup",
+    "trainer_availability", "trainer_load_rollup", "class_occurrence", "booking", "booking_request",
+)
+
+
+def convert_legacy_health_metric(conn):
+    # Converts a legacy health_metric (plain table, text metrics) into the partitioned numeric
+    # table. Returns the number of rows moved, 0 if already converted. The caller commits.
+    if conn.execute(text(LEGACY_HEALTH_METRIC_KIND_SQL)).scalar() != "r":
+        return 0
+
+    conn.execute(text(LEGACY_HEALTH_METRIC_RENAME_SQL))
+    HealthMetric.__table__.create(conn)
+    conn.execute(text(HEALTH_METRIC_PARTITION_FUNCTION))
+    conn.execute(text(LEGACY_HEALTH_METRIC_PARTITIONS_SQL))
+    moved = conn.execute(text(LEGACY_HEALTH_METRIC_COPY_SQL)).rowcount
+    # a dashboard created by step 2 on a pre-versioning database is numeric already; only one made
+    # while the metrics were text still needs converting
+    if conn.execute(text(LEGACY_DASHBOARD_TYPE_SQL)).scalar() in ("text", "character varying"):
+        conn.execute(text(LEGACY_DASHBOARD_NUMERIC_SQL))
+    conn.execute(text(LEGACY_HEALTH_METRIC_FINISH_SQL))
+    print(f"health_metric migrated to numeric, partitioned storage ({moved} rows).")
+    return moved
+
+
+def health_metric_storage(conn):
+    conn.execute(text(HEALTH_METRIC_PARTITION_FUNCTION))
+    convert_legacy_health_metric(conn)
+    conn.execute(text(HEALTH_METRIC_WINDOW_SQL))
+
+
+def class_occurrences(conn):
+    # Moves seats, bookings and queued requests from the weekly class_schedule onto dated
+    # class_occurrence rows. Bookings and requests made before occurrences existed are moved
+    # to their schedule's next occurrence.
+    for sql in (OCCURRENCE_FUNCTION, OCCURRENCE_CAPACITY_SQL, OCCURRENCE_COLUMNS_SQL, OCCURRENCE_BOOKINGS_SQL):
+        conn.execute(text(sql))
+    if conn.execute(text(LEGACY_REQUESTS_CHECK_SQL)).first():
+        conn.execute(text(LEGACY_REQUESTS_SQL))
+    conn.execute(text(OCCURRENCE_INDEXES_SQL))
+
+
+def _normalized(sql):
+    # SQL without -- comments and with whitespace collapsed, so re-commenting or re-indenting a
+    # step does not count as changing it
+    lines = (line.split("--", 1)[0] for line in sql.splitlines())
+    return " ".join(" ".join(lines).split())
+
+
+class Migration:
+    # A step runs its sql statements in order, or its apply function for a step that decides at run
+    # time what to do; tables are model tables created first, checkfirst. The checksum covers the
+    # table names and the normalized SQL the step can execute, which for an apply step is the
+    # statements list it declares, never the Python around them.
+    def __init__(self, version, name, sql=(), apply=None, statements=(), tables=()):
+        self.version = version
+        self.name = name
+        self.sql = (sql,) if isinstance(sql, str) else tuple(sql)
+        self.apply = apply
+        self.tables = tuple(tables)
+        executed = self.sql if apply is None else tuple(statements)
+        definition = "\n".join(self.tables + tuple(_normalized(statement) for statement in executed))
+        self.checksum = hashlib.sha256(definition.encode("utf-8")).hexdigest()
+
+    def run(self, conn):
+        if self.tables:
+            Base.metadata.create_all(conn, tables=[Base.metadata.tables[name] for name in self.tables])
+        if self.apply is not None:
+            self.apply(conn)
+        for statement in self.sql:
+            conn.execute(text(statement))
+
+
+MIGRATIONS = [
+    Migration(1, "btree_gist and timerange", sql=RANGE_TYPES_SQL),
+    Migration(2, "tables", tables=INITIAL_TABLES),
+    Migration(3, "capacity triggers", sql=CAPACITY_TRIGGERS_SQL),
+    Migration(4, "member dashboard triggers", sql=DASHBOARD_SQL),
+    Migration(5, "indexes", sql=INDEXES_SQL),
+    Migration(6, "partitioned numeric health_metric", apply=health_metric_storage, statements=(
+        HEALTH_METRIC_PARTITION_FUNCTION, LEGACY_HEALTH_METRIC_KIND_SQL, LEGACY_HEALTH_METRIC_RENAME_SQL,
+        LEGACY_HEALTH_METRIC_PARTITIONS_SQL, LEGACY_HEALTH_METRIC_COPY_SQL, LEGACY_DASHBOARD_TYPE_SQL,
+        LEGACY_DASHBOARD_NUMERIC_SQL, LEGACY_HEALTH_METRIC_FINISH_SQL, HEALTH_METRIC_WINDOW_SQL,
+    )),
+    Migration(7, "dated class occurrences", apply=class_occurrences, tables=("class_occurrence",), statements=(
+        OCCURRENCE_FUNCTION, OCCURRENCE_CAPACITY_SQL, OCCURRENCE_COLUMNS_SQL, OCCURRENCE_BOOKINGS_SQL,
+        LEGACY_REQUESTS_CHECK_SQL, LEGACY_REQUESTS_SQL, OCCURRENCE_INDEXES_SQL,
+    )),
+    Migration(8, "report rollups", tables=("room_usage_rollup", "trainer_load_rollup", "class_fill_rollup", "report_refresh"),
+              sql=(REPORT_ROLLUP_FUNCTION, REPORT_ROLLUP_BACKFILL_SQL)),
+    Migration(9, "schedule time ranges on legacy tables", sql=SCHEDULE_RANGES_SQL),
+    Migration(10, "member dashboard backfill", sql=DASHBOARD_BACKFILL_SQL),
+]
+
+
+def plan(applied):
+    # applied: {version: checksum} from schema_version. Returns (pending migrations, problems);
+    # problems are steps whose definition changed after they ran, or versions this code does not know
+    known = {migration.version: migration for migration in MIGRATIONS}
+    problems = []
+    for version, checksum in sorted(applied.items()):
+        migration = known.get(version)
+        if migration is None:
+            problems.append(f"schema_version {version} is newer than this code")
+        elif migration.checksum != checksum:
+            problems.append(f"migration {version} ({migration.name}) changed after it was applied")
+    pending = [migration for migration in MIGRATIONS if migration.version not in applied]
+    return pending, problems
@@ -1,20 +1,36 @@
 from datetime import datetime
 
 from sqlalchemy import (
+    CheckConstraint,
     Column,
+    Computed,
+    Date,
     Integer,
+    Index,
+    Numeric,
     String,
     DateTime,
     ForeignKey,
     Time,
+    text,
 )
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from sqlalchemy.orm import DeclarativeBase, relationship
+from sqlalchemy.types import UserDefinedType
 
 
 class Base(DeclarativeBase):
     pass
 
 
+class TimeRange(UserDefinedType):
+    # Postgres range over time of day; the type itself is created by migration 1 (migrations.py)
+    cache_ok = True
+
+    def get_col_spec(self, **kw):
+        return "timerange"
+
+
 class Member(Base):
     __tablename__ = "member"
 
@@ -22,7 +38,7 @@ class Member(Base):
     first_name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
-    password = Column(String, nullable=False)
+    password = Column(String, nullable=False)  # scrypt hash, see credentials.py
     date_of_birth = Column(String)
     gender = Column(String)
     fitness_goals = Column(String)
@@ -32,16 +48,53 @@ class Member(Base):
     health_metrics = relationship("HealthMetric", back_populates="member")
 
 
+class MemberDashboard(Base):
+    __tablename__ = "member_dashboard"
+
+    # one row per member, maintained incrementally by triggers on member, health_metric and booking
+    member_id = Column(Integer, ForeignKey("member.member_id", ondelete="CASCADE"), primary_key=True)
+    latest_metric_id = Column(Integer)
+    weight = Column(Numeric(6, 2))
+    height = Column(Numeric(6, 2))
+    bodyfat = Column(Numeric(5, 2))
+    recorded_at = Column(DateTime)
+    metric_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_bookings = Column(Integer, nullable=False, default=0, server_default="0")
+
+
 class Booking(Base):
     __tablename__ = "booking"
 
     booking_id = Column(Integer, primary_key=True, autoincrement=True)
     member_id = Column(Integer, ForeignKey("member.member_id"), nullable=False)
     schedule_id = Column(Integer, ForeignKey("class_schedule.schedule_id"), nullable=False)
-
+    # the dated class the seat is held in; schedule_id is the occurrence's schedule
+    occurrence_id = Column(Integer, ForeignKey("class_occurrence.occurrence_id", ondelete="CASCADE"), nullable=False)
 
     member = relationship("Member", back_populates="bookings")
     schedule = relationship("ClassSchedule", back_populates="bookings")
+    occurrence = relationship("ClassOccurrence", back_populates="bookings")
+
+
+class BookingRequest(Base):
+    __tablename__ = "booking_request"
+
+    # queued booking attempt, admitted first come first served (request_id order) by the
+    # booking_queue workers: pending -> booked | waitlisted | duplicate, or cancelled by the member;
+    # waitlisted requests are booked when a seat frees up
+    request_id = Column(Integer, primary_key=True, autoincrement=True)
+    member_id = Column(Integer, ForeignKey("member.member_id", ondelete="CASCADE"), nullable=False)
+    occurrence_id = Column(Integer, ForeignKey("class_occurrence.occurrence_id", ondelete="CASCADE"), nullable=False)
+    status = Column(String, nullable=False, default="pending", server_default="pending")
+    booking_id = Column(Integer)
+    requested_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = Column(DateTime)
+
+    __table_args__ = (
+        # only open requests are indexed, so the queue index stays small however long the history grows
+        Index("idx_booking_request_open", "occurrence_id", "request_id",
+              postgresql_where=text("status IN ('pending', 'waitlisted')")),
+    )
 
 
 class HealthMetric(Base):
@@ -49,13 +102,20 @@ class HealthMetric(Base):
 
     metric_id = Column(Integer, primary_key=True, autoincrement=True)
     member_id = Column(Integer, ForeignKey("member.member_id"), nullable=False)
-    weight = Column(String)
-    height = Column(String)
-    bodyfat = Column(String)
-    recorded_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    weight = Column(Numeric(6, 2))  # lbs
+    height = Column(Numeric(6, 2))  # cm
+    bodyfat = Column(Numeric(5, 2))  # percent
+    # partition key, so it is part of the primary key
+    recorded_at = Column(DateTime, default=datetime.utcnow, nullable=False, primary_key=True)
 
     member = relationship("Member", back_populates="health_metrics")
 
+    # monthly range partitions are created by DBManager.create_metric_partitions
+    __table_args__ = (
+        Index("idx_health_metric_member_time", "member_id", recorded_at.desc(), metric_id.desc()),
+        {"postgresql_partition_by": "RANGE (recorded_at)"},
+    )
+
 
 class FitnessClass(Base):
     __tablename__ = "fitness_class"
@@ -76,7 +136,7 @@ class Trainer(Base):
     last_name = Column(String, nullable=False)
     email = Column(String, unique=True, nullable=False)
     specialization = Column(String)
-    password = Column(String, nullable=False)
+    password = Column(String, nullable=False)  # scrypt hash, see credentials.py
 
     schedules = relationship("ClassSchedule", back_populates="trainer")
     availabilities = relationship("TrainerAvailability", back_populates="trainer")
@@ -90,9 +150,16 @@ class TrainerAvailability(Base):
     day_of_week = Column(String, nullable=False)  
     start_time = Column(Time, nullable=False)
     end_time = Column(Time, nullable=False)
+    # [start_time, end_time) as a range so availability checks can use GiST and @>
+    time_slot = Column(TimeRange, Computed("timerange(start_time, end_time)", persisted=True))
 
     trainer = relationship("Trainer", back_populates="availabilities")
 
+    __table_args__ = (
+        CheckConstraint("start_time < end_time", name="availability_valid_times"),
+        Index("idx_availability_slot", "trainer_id", "day_of_week", "time_slot", postgresql_using="gist"),
+    )
+
 
 class ClassSchedule(Base):
     __tablename__ = "class_schedule"
@@ -104,11 +171,44 @@ class ClassSchedule(Base):
     day_of_week = Column(String, nullable=False)
     start_time = Column(Time, nullable=False)
     end_time = Column(Time, nullable=False)
+    # [start_time, end_time) as a range so conflicts can be found with GiST and &&
+    time_slot = Column(TimeRange, Computed("timerange(start_time, end_time)", persisted=True))
 
     fitness_class = relationship("FitnessClass", back_populates="schedules")
     room = relationship("Room", back_populates="schedules")
     trainer = relationship("Trainer", back_populates="schedules")
     bookings = relationship("Booking", back_populates="schedule")
+    occurrences = relationship("ClassOccurrence", back_populates="schedule")
+
+    # a room or trainer can only be used by one class at a time on a given weekday;
+    # back-to-back classes are allowed because the ranges are half-open
+    __table_args__ = (
+        CheckConstraint("start_time < end_time", name="schedule_valid_times"),
+        ExcludeConstraint(("room_id", "="), ("day_of_week", "="), ("time_slot", "&&"),
+                          name="no_room_overlap", using="gist"),
+        ExcludeConstraint(("trainer_id", "="), ("day_of_week", "="), ("time_slot", "&&"),
+                          name="no_trainer_overlap", using="gist"),
+    )
+
+
+class ClassOccurrence(Base):
+    __tablename__ = "class_occurrence"
+
+    # one dated session of a weekly ClassSchedule. Rows are materialized over a rolling horizon by
+    # ensure_class_occurrences (DBManager.ensure_occurrences); bookings and seats belong to them
+    occurrence_id = Column(Integer, primary_key=True, autoincrement=True)
+    schedule_id = Column(Integer, ForeignKey("class_schedule.schedule_id", ondelete="CASCADE"), nullable=False)
+    occurrence_date = Column(Date, nullable=False)
+    # maintained by the enforce_capacity / release_capacity triggers on booking
+    booked_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    schedule = relationship("ClassSchedule", back_populates="occurrences")
+    bookings = relationship("Booking", back_populates="occurrence")
+
+    # date first, so a calendar range reads only that range's rows however much history accumulates
+    __table_args__ = (
+        Index("idx_occurrence_date_schedule", "occurrence_date", "schedule_id", unique=True),
+    )
 
 
 class Room(Base):
@@ -126,4 +226,69 @@ class Admin(Base):
 
     admin_id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String, unique=True, nullable=False)
-    password = Column(String, nullable=False)
+    password = Column(String, nullable=False)  # scrypt hash, see credentials.py
+
+
+class RoomUsageRollup(Base):
+    __tablename__ = "room_usage_rollup"
+
+    # room use per weekday and hour of the day, summed over every rolled up day; the rollups are
+    # advanced by refresh_report_rollups (see ReportRefresh) and only ever read by the reports
+    room_id = Column(Integer, ForeignKey("room.room_id", ondelete="CASCADE"), primary_key=True)
+    day_of_week = Column(String, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    occurrences = Column(Integer, nullable=False, default=0, server_default="0")
+    used_minutes = Column(Integer, nullable=False, default=0, server_default="0")
+    booked_seats = Column(Integer, nullable=False, default=0, server_default="0")
+    seat_capacity = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class TrainerLoadRollup(Base):
+    __tablename__ = "trainer_load_rollup"
+
+    # classes taught per trainer and week (weeks start on Monday)
+    trainer_id = Column(Integer, ForeignKey("trainer.trainer_id", ondelete="CASCADE"), primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    classes = Column(Integer, nullable=False, default=0, server_default="0")
+    taught_minutes = Column(Integer, nullable=False, default=0, server_default="0")
+    booked_seats = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("idx_trainer_load_week", "week_start"),
+    )
+
+
+class ClassFillRollup(Base):
+    __tablename__ = "class_fill_rollup"
+
+    # seats booked against room capacity per class and week
+    class_id = Column(Integer, ForeignKey("fitness_class.class_id", ondelete="CASCADE"), primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    occurrences = Column(Integer, nullable=False, default=0, server_default="0")
+    booked_seats = Column(Integer, nullable=False, default=0, server_default="0")
+    seat_capacity = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        Index("idx_class_fill_week", "week_start"),
+    )
+
+
+class ReportRefresh(Base):
+    __tablename__ = "report_refresh"
+
+    # how far the report rollups have been advanced: class occurrences dated covered_from through
+    # refreshed_through are counted in them, and each refresh only adds the days after that
+    source = Column(String, primary_key=True)
+    covered_from = Column(Date)
+    refreshed_through = Column(Date)
+    refreshed_at = Column(DateTime)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    # one row per applied step of migrations.MIGRATIONS, read in one query at startup
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    checksum = Column(String, nullable=False)  # sha256 of the step's definition
+    applied_at = Column(DateTime, default=datetime.utcnow, nullable=False)
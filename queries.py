@@ -0,0 +1,700 @@
+# queries.py
+# Statement definitions shared by DBManager (sync) and AsyncDBManager (asyncio), so both
+# managers run exactly the same SQL. Builders take plain arguments and return SQLAlchemy
+# statements; format_* helpers turn result rows into the tuples the app expects.
+#
+# The login and booking hot paths return lambda statements (lambda_stmt): the statement inside is
+# built, cache-keyed and compiled once per process, and later calls only bind their values. The
+# lambda calls the plain builder next to it, which benchmark.py --overhead times against it.
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import DateTime, Integer, Numeric, String, and_, case, cast, delete, func, insert, lambda_stmt, literal, literal_column, or_, select, text, true, tuple_, type_coerce, union_all, update
+from sqlalchemy.orm import aliased
+
+from models import Admin, Booking, BookingRequest, ClassFillRollup, ClassOccurrence, ClassSchedule, FitnessClass, HealthMetric, Member, MemberDashboard, ReportRefresh, Room, RoomUsageRollup, SchemaVersion, Trainer, TrainerAvailability, TrainerLoadRollup
+
+
+# role -> (model, unique identity column, id column) for the login paths
+CREDENTIAL_TARGETS = {
+    "member": (Member, Member.email, Member.member_id),
+    "trainer": (Trainer, Trainer.email, Trainer.trainer_id),
+    "admin": (Admin, Admin.username, Admin.admin_id),
+}
+
+METRIC_BUCKETS = ("day", "week", "month")
+
+# Same expression as the idx_member_name_trgm index; the separator is a literal rather than a
+# bind parameter so the planner can match it against the index
+MEMBER_FULL_NAME = Member.first_name + literal_column("' '") + Member.last_name
+
+
+class HealthMetricData:
+    # Simple object to hold health metrics for compatibility with the app screens
+    def __init__(self, weight, height, bodyfat, recorded_at):
+        self.weight = weight
+        self.height = height
+        self.bodyfat = bodyfat
+        self.recorded_at = recorded_at
+
+
+# LOGIN ----------------------------------------------------------------------------------------------
+def credential_select(id_column, password_column, identity_column, identity):
+    return select(id_column, password_column).where(identity_column == identity).limit(1)
+
+
+def credential_lookup(role, identity):
+    # the columns are part of the lambda's cache key, so each role has its own cached statement
+    model, identity_column, id_column = CREDENTIAL_TARGETS[role]
+    password_column = model.password
+    return lambda_stmt(lambda: credential_select(id_column, password_column, identity_column, identity))
+
+
+def password_upgrade(role, account_id, old_hash, new_hash):
+    # compare-and-set so a password changed meanwhile is not overwritten
+    model, _, id_column = CREDENTIAL_TARGETS[role]
+    return update(model).where(
+        id_column == account_id, model.password == old_hash
+    ).values(password=new_hash)
+
+
+# MEMBER ---------------------------------------------------------------------------------------------
+def member_profile(member_id):
+    # Primary key lookup on member joined to its member_dashboard row
+    return select(
+        Member.member_id,
+        Member.first_name,
+        Member.last_name,
+        Member.email,
+        Member.password,
+        Member.fitness_goals,
+        MemberDashboard.weight,
+        MemberDashboard.height,
+        MemberDashboard.bodyfat,
+        MemberDashboard.recorded_at,
+        MemberDashboard.total_bookings,
+        MemberDashboard.metric_count
+    ).outerjoin(MemberDashboard, MemberDashboard.member_id == Member.member_id
+    ).where(Member.member_id == int(member_id))
+
+
+def format_member_profile(row):
+    if row is None:
+        return None
+    health_metric = HealthMetricData(row[6], row[7], row[8], row[9]) if row[9] else None
+    return (row[0], row[1], row[2], row[3], row[4], row[5], health_metric, row[10] or 0, row[11] or 0)
+
+
+def member_search(term, limit, offset=0):
+    # <% (word similarity) is answered from the pg_trgm GIN indexes on name and email, so only
+    # matching members are read; the latest metric comes from member_dashboard in the same query
+    term = term.strip()
+    stmt = select(
+        Member.member_id,
+        Member.first_name,
+        Member.last_name,
+        Member.email,
+        Member.fitness_goals,
+        MemberDashboard.weight,
+        MemberDashboard.height,
+        MemberDashboard.bodyfat,
+        MemberDashboard.recorded_at
+    ).outerjoin(MemberDashboard, MemberDashboard.member_id == Member.member_id)
+
+    if not term:
+        return stmt.add_columns(literal(0.0)).order_by(Member.member_id).limit(limit).offset(offset)
+
+    term = literal(term, String)
+    score = func.greatest(func.word_similarity(term, MEMBER_FULL_NAME), func.word_similarity(term, Member.email))
+    return stmt.add_columns(score).where(or_(
+        # grouped, since <% and || share a precedence level in Postgres
+        term.op("<%", is_comparison=True)(MEMBER_FULL_NAME.self_group()),
+        term.op("<%", is_comparison=True)(Member.email)
+    )).order_by(score.desc(), Member.member_id).limit(limit).offset(offset)
+
+
+def format_member_search(row):
+    health_metric = HealthMetricData(row[5], row[6], row[7], row[8]) if row[8] else None
+    return (row[0], row[1], row[2], row[3], row[4], health_metric, round(float(row[9]), 3))
+
+
+def metric_series(member_ids, bucket="week", start=None, end=None):
+    # Downsampled health metrics for one member or a cohort, aggregated in Postgres. A start/end
+    # range lets the planner skip health_metric partitions outside it.
+    if bucket not in METRIC_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(METRIC_BUCKETS)}")
+    # the unit is inlined (it is whitelisted above) so SELECT and GROUP BY use the same expression
+    period = func.date_trunc(literal_column(f"'{bucket}'"), HealthMetric.recorded_at)
+    stmt = select(
+        period,
+        func.count(),
+        func.round(func.avg(HealthMetric.weight), 2),
+        func.min(HealthMetric.weight),
+        func.max(HealthMetric.weight),
+        func.round(func.avg(HealthMetric.height), 2),
+        func.round(func.avg(HealthMetric.bodyfat), 2),
+        func.min(HealthMetric.bodyfat),
+        func.max(HealthMetric.bodyfat)
+    ).where(HealthMetric.member_id.in_([int(member_id) for member_id in member_ids]))
+
+    if start is not None:
+        stmt = stmt.where(HealthMetric.recorded_at >= start)
+    if end is not None:
+        stmt = stmt.where(HealthMetric.recorded_at < end)
+    return stmt.group_by(period).order_by(period)
+
+
+def member_bookings(member_id):
+    # This query benefits from idx_booking_member index for fast member lookups.
+    # Selecting plain columns keeps it to one statement with no entity loading.
+    # Only bookings for occurrences from today on are listed.
+    return select(
+        Booking.booking_id,
+        FitnessClass.name,
+        ClassOccurrence.occurrence_date,
+        ClassSchedule.start_time,
+        ClassSchedule.end_time
+    ).join(ClassOccurrence, Booking.occurrence_id == ClassOccurrence.occurrence_id
+    ).join(ClassSchedule, ClassOccurrence.schedule_id == ClassSchedule.schedule_id
+    ).join(FitnessClass, ClassSchedule.class_id == FitnessClass.class_id
+    ).where(Booking.member_id == int(member_id), ClassOccurrence.occurrence_date >= func.current_date()
+    ).order_by(ClassOccurrence.occurrence_date, ClassSchedule.start_time, Booking.booking_id)
+
+
+def booking_insert(member_id, occurrence_id):
+    # The trigger 'enforce_capacity' reserves a seat on class_occurrence.booked_count
+    # and rejects the insert if the room is already full. Nothing is inserted for an
+    # unknown or past occurrence. type_coerce rather than literal(), which a lambda's
+    # tracked bind value cannot go through.
+    return insert(Booking).from_select(["occurrence_id", "schedule_id", "member_id"], select(
+        ClassOccurrence.occurrence_id, ClassOccurrence.schedule_id, type_coerce(member_id, Integer)
+    ).where(
+        ClassOccurrence.occurrence_id == occurrence_id,
+        ClassOccurrence.occurrence_date >= func.current_date()
+    )).returning(Booking.booking_id)
+
+
+def insert_booking(member_id, occurrence_id):
+    member_id, occurrence_id = int(member_id), int(occurrence_id)
+    return lambda_stmt(lambda: booking_insert(member_id, occurrence_id))
+
+
+def booking_error_message(error):
+    if "Class is at full capacity" in str(error):
+        return "Class is at full capacity"
+    return str(error)
+
+
+# OCCURRENCES ----------------------------------------------------------------------------------------
+def occurrence_window(horizon_days):
+    # (today, last day of the rolling horizon)
+    today = date.today()
+    return today, today + timedelta(days=horizon_days)
+
+
+def ensure_occurrences(start, end, schedule_id=None):
+    # ensure_class_occurrences is created by migration 7 (migrations.py); returns the rows created
+    return select(func.ensure_class_occurrences(start, end, None if schedule_id is None else int(schedule_id)))
+
+
+def next_occurrence(schedule_id):
+    # the schedule's first occurrence from today on
+    return select(ClassOccurrence.occurrence_id).where(
+        ClassOccurrence.schedule_id == int(schedule_id),
+        ClassOccurrence.occurrence_date >= func.current_date()
+    ).order_by(ClassOccurrence.occurrence_date).limit(1).scalar_subquery()
+
+
+# BOOKING QUEUE ------------------------------------------------------------------------------------
+OPEN_REQUEST_STATUSES = ("pending", "waitlisted")
+
+
+def insert_booking_request(member_id, occurrence_id):
+    # same guard as booking_insert: nothing is inserted for an unknown or past occurrence, which
+    # admission_occurrences would never pick up
+    return insert(BookingRequest).from_select(["occurrence_id", "member_id"], select(
+        ClassOccurrence.occurrence_id, literal(int(member_id), Integer)
+    ).where(
+        ClassOccurrence.occurrence_id == int(occurrence_id),
+        ClassOccurrence.occurrence_date >= func.current_date()
+    )).returning(BookingRequest.request_id)
+
+
+def booking_request(request_id, member_id):
+    # (request_id, occurrence_id, status, booking_id, waitlist position or None)
+    own = aliased(BookingRequest)
+    earlier = select(func.count()).where(
+        BookingRequest.occurrence_id == own.occurrence_id,
+        BookingRequest.status == "waitlisted",
+        BookingRequest.request_id <= own.request_id
+    ).scalar_subquery()
+    return select(
+        own.request_id, own.occurrence_id, own.status, own.booking_id,
+        case((own.status == "waitlisted", earlier), else_=None)
+    ).where(own.request_id == int(request_id), own.member_id == int(member_id))
+
+
+def cancel_booking_request(request_id, member_id):
+    return update(BookingRequest).where(
+        BookingRequest.request_id == int(request_id),
+        BookingRequest.member_id == int(member_id),
+        BookingRequest.status.in_(OPEN_REQUEST_STATUSES)
+    ).values(status="cancelled", processed_at=datetime.utcnow()).returning(BookingRequest.request_id)
+
+
+def admission_occurrences(limit):
+    # Occurrences with pending requests, or with waitlisted ones and a seat free again. They are
+    # locked in id order (like book_many) and SKIP LOCKED leaves occurrences another worker is
+    # admitting to that worker, so each occurrence's queue is decided by one worker at a time.
+    # Returns (occurrence_id, schedule_id, free seats); past occurrences are no longer admitted to.
+    pending = select(BookingRequest.occurrence_id).where(BookingRequest.status == "pending")
+    waiting = select(BookingRequest.occurrence_id).where(BookingRequest.status == "waitlisted")
+    return select(
+        ClassOccurrence.occurrence_id,
+        ClassOccurrence.schedule_id,
+        Room.capacity - ClassOccurrence.booked_count
+    ).join(ClassSchedule, ClassOccurrence.schedule_id == ClassSchedule.schedule_id
+    ).join(Room, ClassSchedule.room_id == Room.room_id).where(
+        ClassOccurrence.occurrence_date >= func.current_date(),
+        or_(
+            ClassOccurrence.occurrence_id.in_(pending),
+            and_(ClassOccurrence.occurrence_id.in_(waiting), ClassOccurrence.booked_count < Room.capacity)
+        )
+    ).order_by(ClassOccurrence.occurrence_id).limit(limit).with_for_update(of=ClassOccurrence, skip_locked=True)
+
+
+def admission_requests(open_occurrences, full_occurrences, limit):
+    # open requests of the locked occurrences in arrival order; the waitlist of a full occurrence is
+    # skipped so it cannot crowd pending requests out of the batch
+    return select(BookingRequest.request_id, BookingRequest.member_id, BookingRequest.occurrence_id, BookingRequest.status
+                  ).where(
+        BookingRequest.occurrence_id.in_(open_occurrences),
+        or_(BookingRequest.status == "pending",
+            and_(BookingRequest.status == "waitlisted", BookingRequest.occurrence_id.not_in(full_occurrences)))
+    ).order_by(BookingRequest.request_id).limit(limit)
+
+
+def existing_bookings(pairs):
+    # pairs of (member_id, occurrence_id)
+    return select(Booking.member_id, Booking.occurrence_id).where(tuple_(Booking.member_id, Booking.occurrence_id).in_(pairs))
+
+
+def member_booking_delete(booking_id, member_id):
+    return delete(Booking).where(
+        Booking.booking_id == booking_id, Booking.member_id == member_id
+    ).returning(Booking.booking_id)
+
+
+def delete_member_booking(booking_id, member_id):
+    booking_id, member_id = int(booking_id), int(member_id)
+    return lambda_stmt(lambda: member_booking_delete(booking_id, member_id))
+
+
+def available_classes(day_of_week=None, class_name=None, only_available=False, limit=None, offset=0,
+                      start_date=None, end_date=None):
+    # Class occurrences between start_date and end_date (inclusive; today and the next 6 days by
+    # default). The range is read through idx_occurrence_date_schedule, so a week's calendar
+    # touches only that week's rows. booked_count is kept current by the booking triggers,
+    # so no join on booking is needed.
+    start_date = start_date or date.today()
+    end_date = end_date or start_date + timedelta(days=6)
+    stmt = select(
+        ClassOccurrence.occurrence_id,
+        ClassOccurrence.occurrence_date,
+        FitnessClass.name,
+        Room.room_name,
+        ClassSchedule.start_time,
+        ClassSchedule.end_time,
+        ClassOccurrence.booked_count,
+        Room.capacity
+    ).join(ClassSchedule, ClassOccurrence.schedule_id == ClassSchedule.schedule_id
+    ).join(FitnessClass, ClassSchedule.class_id == FitnessClass.class_id
+    ).join(Room, ClassSchedule.room_id == Room.room_id
+    ).where(ClassOccurrence.occurrence_date >= start_date, ClassOccurrence.occurrence_date <= end_date)
+
+    if day_of_week:
+        stmt = stmt.where(ClassSchedule.day_of_week == day_of_week)
+    if class_name:
+        stmt = stmt.where(FitnessClass.name.ilike(f"%{class_name}%"))
+    if only_available:
+        stmt = stmt.where(ClassOccurrence.booked_count < Room.capacity)
+
+    stmt = stmt.order_by(ClassOccurrence.occurrence_date, ClassSchedule.start_time, ClassOccurrence.occurrence_id
+                         ).offset(offset)
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def format_available_class(row):
+    occurrence_id, occurrence_date, name, room_name, start_time, end_time, count, capacity = row
+    return (occurrence_id, occurrence_date, name, room_name, start_time, end_time, f"{count}/{capacity}", capacity - count)
+
+
+# TRAINER --------------------------------------------------------------------------------------------
+def trainer_schedule(trainer_id):
+    return select(
+        FitnessClass.name,
+        Room.room_name,
+        ClassSchedule.start_time,
+        ClassSchedule.end_time
+    ).join(FitnessClass, ClassSchedule.class_id == FitnessClass.class_id
+    ).join(Room, ClassSchedule.room_id == Room.room_id
+    ).where(ClassSchedule.trainer_id == int(trainer_id)
+    ).order_by(ClassSchedule.schedule_id)
+
+
+# ADMIN ----------------------------------------------------------------------------------------------
+def all_classes():
+    return select(FitnessClass.class_id, FitnessClass.name, FitnessClass.description, FitnessClass.duration
+                  ).order_by(FitnessClass.class_id)
+
+
+def insert_class(name, description, duration):
+    return insert(FitnessClass).values(name=name, description=description, duration=int(duration)
+                                       ).returning(FitnessClass.class_id)
+
+
+def delete_class(class_id):
+    return delete(FitnessClass).where(FitnessClass.class_id == int(class_id)).returning(FitnessClass.class_id)
+
+
+def all_rooms():
+    return select(Room.room_id, Room.room_name, Room.capacity).order_by(Room.room_id)
+
+
+def insert_room(room_name, capacity):
+    return insert(Room).values(room_name=room_name, capacity=int(capacity)).returning(Room.room_id)
+
+
+def delete_room(room_id):
+    return delete(Room).where(Room.room_id == int(room_id)).returning(Room.room_id)
+
+
+def all_schedules():
+    return select(
+        ClassSchedule.schedule_id,
+        FitnessClass.name,
+        Room.room_name,
+        Trainer.first_name + " " + Trainer.last_name,
+        ClassSchedule.start_time,
+        ClassSchedule.end_time
+    ).join(FitnessClass, ClassSchedule.class_id == FitnessClass.class_id
+    ).join(Room, ClassSchedule.room_id == Room.room_id
+    ).join(Trainer, ClassSchedule.trainer_id == Trainer.trainer_id
+    ).order_by(ClassSchedule.schedule_id)
+
+
+def insert_schedule(class_id, room_id, trainer_id, day_of_week, start_time, end_time):
+    return insert(ClassSchedule).values(
+        class_id=int(class_id),
+        room_id=int(room_id),
+        trainer_id=int(trainer_id),
+        day_of_week=day_of_week,
+        start_time=start_time,
+        end_time=end_time
+    ).returning(ClassSchedule.schedule_id)
+
+
+def insert_schedules(rows):
+    # one multi-row INSERT for a generated timetable; rows as (class_id, room_id, trainer_id, day, start, end)
+    return insert(ClassSchedule).values([
+        {"class_id": int(class_id), "room_id": int(room_id), "trainer_id": int(trainer_id),
+         "day_of_week": day_of_week, "start_time": start_time, "end_time": end_time}
+        for class_id, room_id, trainer_id, day_of_week, start_time, end_time in rows
+    ]).returning(ClassSchedule.schedule_id)
+
+
+def timetable_trainers():
+    return select(Trainer.trainer_id, Trainer.first_name + " " + Trainer.last_name, Trainer.specialization)
+
+
+def timetable_availability():
+    return select(TrainerAvailability.trainer_id, TrainerAvailability.day_of_week,
+                  TrainerAvailability.start_time, TrainerAvailability.end_time)
+
+
+def timetable_schedules():
+    return select(ClassSchedule.room_id, ClassSchedule.trainer_id, ClassSchedule.day_of_week,
+                  ClassSchedule.start_time, ClassSchedule.end_time)
+
+
+def consume_availability(trainer_id, day_of_week, start_time, end_time):
+    # removes one availability slot of the trainer that covers (@>) the scheduled time
+    covering = select(TrainerAvailability.availability_id).where(
+        TrainerAvailability.trainer_id == int(trainer_id),
+        TrainerAvailability.day_of_week == day_of_week,
+        TrainerAvailability.time_slot.op("@>", is_comparison=True)(func.timerange(start_time, end_time))
+    ).limit(1).scalar_subquery()
+    return delete(TrainerAvailability).where(TrainerAvailability.availability_id == covering)
+
+
+def schedule_error_message(error):
+    # the exclusion constraints reject overlaps even when two admins schedule at once
+    if "no_room_overlap" in str(error):
+        return "Room is already booked at that time"
+    if "no_trainer_overlap" in str(error):
+        return "Trainer is already teaching at that time"
+    return str(error)
+
+
+def delete_schedule_bookings(schedule_id):
+    # one statement, so release_capacity fires once for all of the schedule's bookings
+    return delete(Booking).where(Booking.schedule_id == int(schedule_id))
+
+
+def delete_schedule(schedule_id):
+    return delete(ClassSchedule).where(ClassSchedule.schedule_id == int(schedule_id)).returning(ClassSchedule.schedule_id)
+
+
+# REPORTS --------------------------------------------------------------------------------------------
+# Report screens read only the rollup tables, which refresh_report_rollups (migration 8) advances
+# one finished day at a time, so their cost does not grow with the booking history.
+REPORT_SOURCE = "class_occurrence"
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def rollup_through():
+    # the last day whose seat counts are final
+    return date.today() - timedelta(days=1)
+
+
+def report_weeks(weeks):
+    # (first Monday, this Monday): the last `weeks` complete weeks
+    this_week = date.today() - timedelta(days=date.today().weekday())
+    return this_week - timedelta(weeks=int(weeks)), this_week
+
+
+def refresh_report_rollups(through):
+    # returns the number of class occurrences added to the rollups
+    return select(func.refresh_report_rollups(through))
+
+
+def report_coverage():
+    return select(ReportRefresh.covered_from, ReportRefresh.refreshed_through, ReportRefresh.refreshed_at
+                  ).where(ReportRefresh.source == REPORT_SOURCE)
+
+
+def _weekday_counts():
+    # how many Mondays, Tuesdays, ... the rollups cover: the hours a room could have been used
+    days = func.generate_series(
+        cast(ReportRefresh.covered_from, DateTime), cast(ReportRefresh.refreshed_through, DateTime),
+        literal_column("interval '1 day'")
+    ).table_valued("day").lateral("days")
+    weekday = func.to_char(days.c.day, literal_column("'FMDay'"))
+    return select(weekday.label("day_of_week"), func.count().label("days")
+                  ).select_from(ReportRefresh).join(days, true()
+                  ).where(ReportRefresh.source == REPORT_SOURCE).group_by(weekday).subquery()
+
+
+def room_occupancy(room_id=None):
+    # (room_id, room, weekday, hour, occupancy, seat fill, rank): occupancy is the share of that
+    # hour the room hosted a class over every covered day, seat fill how full those classes were,
+    # and rank orders a room's slots busiest first
+    weekdays = _weekday_counts()
+    occupancy = func.round(cast(RoomUsageRollup.used_minutes, Numeric) / (weekdays.c.days * 60), 3)
+    stmt = select(
+        Room.room_id,
+        Room.room_name,
+        RoomUsageRollup.day_of_week,
+        RoomUsageRollup.hour,
+        occupancy,
+        func.round(cast(RoomUsageRollup.booked_seats, Numeric) / func.nullif(RoomUsageRollup.seat_capacity, 0), 3),
+        func.rank().over(partition_by=RoomUsageRollup.room_id, order_by=occupancy.desc())
+    ).join(Room, RoomUsageRollup.room_id == Room.room_id
+    ).join(weekdays, weekdays.c.day_of_week == RoomUsageRollup.day_of_week)
+    if room_id is not None:
+        stmt = stmt.where(RoomUsageRollup.room_id == int(room_id))
+    weekday_order = case({day: position for position, day in enumerate(WEEKDAYS)}, value=RoomUsageRollup.day_of_week)
+    return stmt.order_by(Room.room_id, weekday_order, RoomUsageRollup.hour)
+
+
+def trainer_load(weeks=4):
+    # (trainer_id, name, classes, taught hours/week, declared hours/week, utilization, rank, club
+    # average hours/week) over the last `weeks` complete weeks. add_schedule consumes the
+    # availability slot a class takes and apply_timetable does not, so declared hours are the
+    # union (range_agg) of the trainer's remaining availability and scheduled classes per weekday:
+    # the same on both paths, and never counting a scheduled hour twice
+    start, end = report_weeks(weeks)
+    taught = select(
+        TrainerLoadRollup.trainer_id,
+        func.sum(TrainerLoadRollup.classes).label("classes"),
+        func.sum(TrainerLoadRollup.taught_minutes).label("minutes")
+    ).where(TrainerLoadRollup.week_start >= start, TrainerLoadRollup.week_start < end
+    ).group_by(TrainerLoadRollup.trainer_id).subquery()
+    slots = union_all(
+        select(TrainerAvailability.trainer_id, func.lower(TrainerAvailability.day_of_week).label("day"),
+               TrainerAvailability.time_slot.label("slot")),
+        select(ClassSchedule.trainer_id, func.lower(ClassSchedule.day_of_week), ClassSchedule.time_slot)
+    ).subquery()
+    covered = select(
+        slots.c.trainer_id, func.unnest(func.range_agg(slots.c.slot)).label("slot")
+    ).group_by(slots.c.trainer_id, slots.c.day).subquery()
+    declared = select(
+        covered.c.trainer_id,
+        func.sum(func.extract("epoch", func.upper(covered.c.slot) - func.lower(covered.c.slot)) / 60).label("minutes")
+    ).group_by(covered.c.trainer_id).subquery()
+
+    weekly_minutes = cast(func.coalesce(taught.c.minutes, 0), Numeric) / int(weeks)
+    weekly_hours = func.round(weekly_minutes / 60, 1)
+    return select(
+        Trainer.trainer_id,
+        Trainer.first_name + " " + Trainer.last_name,
+        func.coalesce(taught.c.classes, 0),
+        weekly_hours,
+        func.round(cast(func.coalesce(declared.c.minutes, 0), Numeric) / 60, 1),
+        func.round(weekly_minutes / func.nullif(cast(declared.c.minutes, Numeric), 0), 3),
+        func.rank().over(order_by=weekly_minutes.desc()),
+        func.round(func.avg(weekly_hours).over(), 1)
+    ).outerjoin(taught, taught.c.trainer_id == Trainer.trainer_id
+    ).outerjoin(declared, declared.c.trainer_id == Trainer.trainer_id
+    ).order_by(weekly_minutes.desc(), Trainer.trainer_id)
+
+
+def class_fill(weeks=4):
+    # (class_id, class, week, occurrences, booked seats, seat capacity, fill ratio, change from the
+    # class's previous week, fill over the whole period) for the last `weeks` complete weeks
+    start, end = report_weeks(weeks)
+    fill = cast(ClassFillRollup.booked_seats, Numeric) / func.nullif(ClassFillRollup.seat_capacity, 0)
+    by_class = {"partition_by": ClassFillRollup.class_id}
+    return select(
+        FitnessClass.class_id,
+        FitnessClass.name,
+        ClassFillRollup.week_start,
+        ClassFillRollup.occurrences,
+        ClassFillRollup.booked_seats,
+        ClassFillRollup.seat_capacity,
+        func.round(fill, 3),
+        func.round(fill - func.lag(fill).over(order_by=ClassFillRollup.week_start, **by_class), 3),
+        func.round(cast(func.sum(ClassFillRollup.booked_seats).over(**by_class), Numeric)
+                   / func.nullif(func.sum(ClassFillRollup.seat_capacity).over(**by_class), 0), 3)
+    ).join(FitnessClass, ClassFillRollup.class_id == FitnessClass.class_id
+    ).where(ClassFillRollup.week_start >= start, ClassFillRollup.week_start < end
+    ).order_by(FitnessClass.class_id, ClassFillRollup.week_start)
+
+
+# SCHEMA ---------------------------------------------------------------------------------------------
+def schema_versions():
+    return select(SchemaVersion.version, SchemaVersion.checksum)
+
+
+def insert_schema_version(version, name, checksum):
+    return insert(SchemaVersion).values(version=version, name=name, checksum=checksum)
+
+
+# EXPORT ---------------------------------------------------------------------------------------------
+def export_bookings():
+    return select(Booking.booking_id, Booking.member_id, Booking.schedule_id, Booking.occurrence_id)
+
+
+def export_booking_facts():
+    # one row per booking with its class, room, trainer and date denormalized for analytics
+    return select(
+        Booking.booking_id,
+        Booking.member_id,
+        Booking.occurrence_id,
+        ClassOccurrence.occurrence_date,
+        ClassSchedule.schedule_id,
+        ClassSchedule.class_id,
+        FitnessClass.name.label("class_name"),
+        ClassSchedule.room_id,
+        Room.room_name,
+        ClassSchedule.trainer_id,
+        ClassSchedule.day_of_week,
+        ClassSchedule.start_time,
+        ClassSchedule.end_time
+    ).join(ClassOccurrence, Booking.occurrence_id == ClassOccurrence.occurrence_id
+    ).join(ClassSchedule, ClassOccurrence.schedule_id == ClassSchedule.schedule_id
+    ).join(FitnessClass, ClassSchedule.class_id == FitnessClass.class_id
+    ).join(Room, ClassSchedule.room_id == Room.room_id)
+
+
+def export_schedules():
+    return select(ClassSchedule.schedule_id, ClassSchedule.class_id, ClassSchedule.room_id, ClassSchedule.trainer_id,
+                  ClassSchedule.day_of_week, ClassSchedule.start_time, ClassSchedule.end_time)
+
+
+def export_occurrences():
+    return select(ClassOccurrence.occurrence_id, ClassOccurrence.schedule_id, ClassOccurrence.occurrence_date,
+                  ClassOccurrence.booked_count)
+
+
+def export_health_metrics():
+    return select(HealthMetric.metric_id, HealthMetric.member_id, HealthMetric.weight, HealthMetric.height,
+                  HealthMetric.bodyfat, HealthMetric.recorded_at)
+
+
+# dataset -> (statement builder, table whose rows are tracked). Incremental exports follow the
+# transaction that inserted each row (its xmin), not its id: ids are drawn from nextval at insert
+# time, in no fixed order relative to the transactions' xids or commits, so an id watermark can
+# pass a row that commits later below it.
+EXPORT_DATASETS = {
+    "bookings": (export_bookings, Booking.__table__),
+    "booking_facts": (export_booking_facts, Booking.__table__),
+    "schedules": (export_schedules, ClassSchedule.__table__),
+    "occurrences": (export_occurrences, ClassOccurrence.__table__),
+    "health_metrics": (export_health_metrics, HealthMetric.__table__),
+}
+
+# the oldest transaction still running when the snapshot was taken; every xid below it has ended
+SNAPSHOT_XMIN_SQL = "pg_snapshot_xmin(pg_current_snapshot())"
+
+
+def export_cursor():
+    # the cursor the next incremental export starts from, read in the export's own snapshot
+    return select(literal_column(f"{SNAPSHOT_XMIN_SQL}::text"))
+
+
+def _inserted_between(table, since):
+    # Rows written by transactions that had ended when the snapshot was taken (xid below its xmin)
+    # and, incrementally, had not ended by the previous export's snapshot (xid at or above since,
+    # that export's xmin). Each committed row therefore falls in exactly one export, whatever its
+    # id. age() compares 32-bit xids relative to now, so it holds across wraparound; a full export
+    # also keeps the frozen rows older than 2^31 transactions, whose age reads negative.
+    row_age = f"age({table.name}.xmin)"
+    current_age = f"age({SNAPSHOT_XMIN_SQL}::xid)"
+    if since is None:
+        return text(f"{row_age} NOT BETWEEN 0 AND {current_age}")
+    return text(f"{row_age} > {current_age} AND {row_age} <= age(CAST(:export_since AS xid8)::xid)"
+                ).bindparams(export_since=str(since))
+
+
+def export_rows(dataset, since=None):
+    # rows of dataset inserted (or last updated) since the snapshot xmin of the previous export, all
+    # of them when since is None; unordered, so a full export is a plain scan
+    builder, table = EXPORT_DATASETS[dataset]
+    return builder().where(_inserted_between(table, since))
+
+
+# Recomputes every member's dashboard row from health_metric and booking
+# (DBManager.rebuild_member_dashboard). SHARE ROW EXCLUSIVE lets dashboard reads continue but makes
+# the triggers wait, so no delta is lost between the snapshot and the upsert.
+REBUILD_DASHBOARD_SQL = """
+    LOCK TABLE member_dashboard IN SHARE ROW EXCLUSIVE MODE;
+
+    INSERT INTO member_dashboard AS d
+        (member_id, latest_metric_id, weight, height, bodyfat, recorded_at,
+         metric_count, total_bookings)
+    SELECT m.member_id, latest.metric_id, latest.weight, latest.height,
+           latest.bodyfat, latest.recorded_at,
+           COALESCE(metrics.metric_count, 0), COALESCE(bookings.total_bookings, 0)
+    FROM member m
+    LEFT JOIN (
+        SELECT DISTINCT ON (member_id) member_id, metric_id, weight, height, bodyfat, recorded_at
+        FROM health_metric
+        ORDER BY member_id, recorded_at DESC, metric_id DESC
+    ) latest ON latest.member_id = m.member_id
+    LEFT JOIN (
+        SELECT member_id, COUNT(*) AS metric_count FROM health_metric GROUP BY member_id
+    ) metrics ON metrics.member_id = m.member_id
+    LEFT JOIN (
+        SELECT member_id, COUNT(*) AS total_bookings FROM booking GROUP BY member_id
+    ) bookings ON bookings.member_id = m.member_id
+    ON CONFLICT (member_id) DO UPDATE SET
+        latest_metric_id = EXCLUDED.latest_metric_id,
+        weight = EXCLUDED.weight,
+        height = EXCLUDED.height,
+        bodyfat = EXCLUDED.bodyfat,
+        recorded_at = EXCLUDED.recorded_at,
+        metric_count = EXCLUDED.metric_count,
+        total_bookings = EXCLUDED.total_bookings;
+"""
@@ -0,0 +1,155 @@
+# replicas.py
+# Read routing for DBManager. Read-only methods ask ReplicaRouter for an engine: one of the
+# replicas, picked round-robin or by fewest checked out connections, or None for the primary.
+# A replica is only used while its replay lag is within replica_max_lag_ms. The lag is checked
+# every replica_check_seconds by one background thread per replica, so routing only reads the
+# last result and a dead or slow replica never holds up a read; a result older than a few check
+# intervals (a check stuck connecting) counts as unusable. When none qualifies reads go to the primary. A member who has just
+# written (booking, profile, metrics) reads from the primary for replica_sticky_seconds, so they
+# always see their own change.
+import itertools
+import threading
+import time
+
+from sqlalchemy import text
+
+STRATEGIES = ("round_robin", "least_connections")
+
+# 0 on a server that is not in recovery, so a stand-in "replica" URL pointing at the primary is
+# always current. A standby must be streaming: with the WAL receiver gone, received = replayed
+# says nothing about the primary, so it gets NULL (unusable). Otherwise 0 when everything received
+# has been replayed, else the age of the last replayed transaction.
+LAG_SQL = text("""
+    SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) * 1000, 0) END
+""")
+# results older than this many check intervals are treated as unknown
+STALE_CHECKS = 3
+
+
+class Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.lag_ms = None  # None until checked, or when the last check failed
+        self.error = None
+        self.checked_at = None
+        self.reads = 0
+
+    def connections(self):
+        # connections in use, from the Timed*Pool counters
+        return getattr(self.engine.pool, "in_use", 0)
+
+
+class ReplicaRouter:
+    def __init__(self, engines, strategy="round_robin", max_lag_ms=5000, check_seconds=2, sticky_seconds=10):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown replica_strategy: {strategy}")
+        self.replicas = [Replica(engine) for engine in engines]
+        self.strategy = strategy
+        self.max_lag_ms = max_lag_ms
+        self.check_seconds = check_seconds
+        self.sticky_seconds = sticky_seconds
+        self._turn = itertools.count()
+        self._sticky = {}  # member_id -> monotonic time their reads may leave the primary
+        self._lock = threading.Lock()
+        self.primary_reads = {"sticky": 0, "lagging": 0}
+        self._stop = threading.Event()
+        self._monitors = [threading.Thread(target=self._monitor, args=(replica,), daemon=True,
+                                           name=f"replica-lag-{i}") for i, replica in enumerate(self.replicas)]
+        for monitor in self._monitors:
+            monitor.start()
+
+    def mark_write(self, member_id):
+        with self._lock:
+            self._sticky[int(member_id)] = time.monotonic() + self.sticky_seconds
+
+    def _is_sticky(self, member_id):
+        if member_id is None:
+            return False
+        with self._lock:
+            until = self._sticky.get(int(member_id))
+            if until is None:
+                return False
+            if until > time.monotonic():
+                return True
+            del self._sticky[int(member_id)]
+            return False
+
+    def _check(self, replica):
+        try:
+            with replica.engine.connect() as conn:
+                lag_ms = conn.execute(LAG_SQL).scalar()
+            replica.lag_ms = None if lag_ms is None else float(lag_ms)
+            replica.error = None if lag_ms is not None else "WAL receiver not streaming"
+        except Exception as e:
+            replica.lag_ms = None
+            replica.error = str(e).splitlines()[0]
+        finally:
+            replica.checked_at = time.monotonic()
+
+    def _monitor(self, replica):
+        while not self._stop.is_set():
+            self._check(replica)
+            self._stop.wait(self.check_seconds)
+
+    def wait_for_checks(self, timeout=10):
+        # blocks until every replica has been checked once; routing sends reads to the primary until then
+        deadline = time.monotonic() + timeout
+        while any(replica.checked_at is None for replica in self.replicas) and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _usable(self, replica):
+        # only the monitor's last result; never touches the replica
+        checked_at, lag_ms = replica.checked_at, replica.lag_ms
+        if checked_at is None or time.monotonic() - checked_at > self.check_seconds * STALE_CHECKS:
+            return False
+        return lag_ms is not None and lag_ms <= self.max_lag_ms
+
+    def engine_for(self, member_id=None):
+        # The engine a read should use, or None for the primary. member_id is the member the read
+        # is for, if any.
+        if not self.replicas:
+            return None
+        if self._is_sticky(member_id):
+            with self._lock:
+                self.primary_reads["sticky"] += 1
+            return None
+        candidates = [replica for replica in self.replicas if self._usable(replica)]
+        if not candidates:
+            with self._lock:
+                self.primary_reads["lagging"] += 1
+            return None
+        # rotate the candidates so that round-robin takes turns and least-connections breaks ties fairly
+        start = next(self._turn) % len(candidates)
+        candidates = candidates[start:] + candidates[:start]
+        if self.strategy == "least_connections":
+            replica = min(candidates, key=Replica.connections)
+        else:
+            replica = candidates[0]
+        with self._lock:
+            replica.reads += 1
+        return replica.engine
+
+    def stats(self):
+        with self._lock:
+            stats = {"strategy": self.strategy, "primary_reads": dict(self.primary_reads), "replicas": []}
+            for replica in self.replicas:
+                stats["replicas"].append({
+                    "url": replica.engine.url.render_as_string(hide_password=True),
+                    "lag_ms": None if replica.lag_ms is None else round(replica.lag_ms, 1),
+                    "usable": self._usable(replica),
+                    "reads": replica.reads,
+                    "connections": replica.connections(),
+                    "error": replica.error,
+                })
+        return stats
+
+    def dispose(self):
+        self._stop.set()
+        # a check in progress would otherwise reconnect to a disposed engine and leak the connection
+        for monitor in self._monitors:
+            monitor.join(timeout=self.check_seconds)
+        for replica in self.replicas:
+            replica.engine.dispose()
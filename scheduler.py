@@ -0,0 +1,277 @@
+# scheduler.py
+# Batch weekly timetable generator. All inputs are loaded once (DBManager.get_timetable_inputs),
+# placement is solved in memory and the plan is written in one transaction
+# (DBManager.apply_timetable). Times are handled as minutes since midnight.
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import time as dt_time
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# score weights: lower is better
+SAME_DAY_PENALTY = 100      # another session of the same class on that day
+TRAINER_LOAD_PENALTY = 10   # per session the trainer already teaches in the plan
+NO_SPECIALTY_PENALTY = 20   # trainer's specialization does not mention the class
+ROOM_WASTE_PENALTY = 1      # per seat above the requested capacity
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def to_time(minutes):
+    return dt_time(minutes // 60, minutes % 60)
+
+
+class ClassRequest:
+    # sessions_per_week sessions of class_id, in rooms with at least min_capacity seats, taught by a
+    # trainer whose specialization contains specialization (any trainer when None)
+    def __init__(self, class_id, sessions_per_week, min_capacity=0, specialization=None):
+        self.class_id = class_id
+        self.sessions_per_week = sessions_per_week
+        self.min_capacity = min_capacity or 0
+        self.specialization = specialization or None
+
+
+class TimetableInputs:
+    def __init__(self, classes, rooms, trainers, availability, schedules):
+        # classes: {class_id: (name, duration)}, rooms: {room_id: (name, capacity)},
+        # trainers: {trainer_id: (name, specialization)}, availability: [(trainer_id, day, start, end)],
+        # schedules: existing [(room_id, trainer_id, day, start, end)]; times as datetime.time
+        self.classes = classes
+        self.rooms = rooms
+        self.trainers = trainers
+        self.availability = defaultdict(list)
+        for trainer_id, day, start, end in availability:
+            self.availability[(trainer_id, day)].append((to_minutes(start), to_minutes(end)))
+        for windows in self.availability.values():
+            windows.sort()
+        self.schedules = [(room_id, trainer_id, day, to_minutes(start), to_minutes(end))
+                          for room_id, trainer_id, day, start, end in schedules]
+
+
+class IntervalIndex:
+    # Busy intervals per (resource, day) kept sorted by start. Intervals of one key never overlap,
+    # so an overlap query is a bisect plus a short walk back.
+    def __init__(self):
+        self._starts = defaultdict(list)
+        self._intervals = defaultdict(list)
+
+    def add(self, key, start, end, owner):
+        index = bisect_left(self._starts[key], start)
+        self._starts[key].insert(index, start)
+        self._intervals[key].insert(index, (start, end, owner))
+
+    def remove(self, key, start, owner):
+        intervals = self._intervals[key]
+        index = bisect_left(self._starts[key], start)
+        while intervals[index][2] is not owner:
+            index += 1
+        del self._starts[key][index]
+        del intervals[index]
+
+    def overlapping(self, key, start, end):
+        # intervals [s, e) with s < end and e > start
+        intervals = self._intervals.get(key)
+        if not intervals:
+            return []
+        index = bisect_left(self._starts[key], end) - 1
+        found = []
+        while index >= 0 and intervals[index][1] > start:
+            found.append(intervals[index])
+            index -= 1
+        return found
+
+
+class Session:
+    def __init__(self, request, duration, trainers, preferred, rooms):
+        self.request = request
+        self.class_id = request.class_id
+        self.duration = duration
+        self.trainers = trainers
+        self.preferred = preferred
+        # fitting rooms, smallest first
+        self.rooms = rooms
+        self.placement = None
+
+
+class Placement:
+    def __init__(self, session, room_id, trainer_id, day, start):
+        self.session = session
+        self.room_id = room_id
+        self.trainer_id = trainer_id
+        self.day = day
+        self.start = start
+        self.end = start + session.duration
+
+    def row(self):
+        # argument order of DBManager.add_schedule / apply_timetable
+        return (self.session.class_id, self.room_id, self.trainer_id, self.day, to_time(self.start), to_time(self.end))
+
+
+class TimetablePlan:
+    def __init__(self, placements, unplaced, seconds, repaired):
+        self.placements = placements
+        # [(class_id, reason)]
+        self.unplaced = unplaced
+        self.seconds = seconds
+        self.repaired = repaired
+
+    def rows(self):
+        return [placement.row() for placement in sorted(
+            self.placements, key=lambda p: (DAYS.index(p.day) if p.day in DAYS else len(DAYS), p.start, p.room_id))]
+
+
+class TimetableSolver:
+    # Greedy placement of the most constrained sessions first, followed by a local repair pass
+    # that moves one already placed session out of the way of each session left over.
+    def __init__(self, inputs, grid_minutes=15, repair_attempts=200):
+        self.inputs = inputs
+        self.grid = grid_minutes
+        self.repair_attempts = repair_attempts
+        self.busy = IntervalIndex()
+        self.trainer_load = Counter()
+        self.class_days = defaultdict(Counter)
+        # existing schedules are fixed (owner None)
+        for room_id, trainer_id, day, start, end in inputs.schedules:
+            self.busy.add(("room", room_id, day), start, end, None)
+            self.busy.add(("trainer", trainer_id, day), start, end, None)
+
+    def _sessions(self, requests, unplaced):
+        rooms_by_size = sorted(self.inputs.rooms.items(), key=lambda item: (item[1][1], item[0]))
+        available_trainers = sorted({trainer_id for trainer_id, _ in self.inputs.availability})
+        sessions = []
+        for request in requests:
+            if request.class_id not in self.inputs.classes:
+                unplaced.extend([(request.class_id, "unknown class")] * request.sessions_per_week)
+                continue
+            name, duration = self.inputs.classes[request.class_id]
+            wanted = (request.specialization or "").lower()
+            trainers = [t for t in available_trainers
+                        if wanted in (self.inputs.trainers.get(t, ("", ""))[1] or "").lower()]
+            preferred = {t for t in trainers if name.lower() in (self.inputs.trainers[t][1] or "").lower()}
+            rooms = [(room_id, capacity) for room_id, (_, capacity) in rooms_by_size if capacity >= request.min_capacity]
+            if not trainers:
+                unplaced.extend([(request.class_id, "no available trainer with that specialization")] * request.sessions_per_week)
+                continue
+            if not rooms:
+                unplaced.extend([(request.class_id, f"no room with {request.min_capacity} seats")] * request.sessions_per_week)
+                continue
+            for _ in range(request.sessions_per_week):
+                sessions.append(Session(request, duration, trainers, preferred, rooms))
+        # fewest options first, longer classes first among equals
+        sessions.sort(key=lambda s: (len(s.trainers) * len(s.rooms), -s.duration))
+        return sessions
+
+    def _free_room(self, session, day, start, end):
+        for room_id, capacity in session.rooms:
+            if not self.busy.overlapping(("room", room_id, day), start, end):
+                return room_id, capacity
+        return None
+
+    def _best_slot(self, session):
+        best = None
+        smallest_waste = session.rooms[0][1] - session.request.min_capacity
+        for day in DAYS:
+            day_penalty = self.class_days[session.class_id][day] * SAME_DAY_PENALTY
+            for trainer_id in session.trainers:
+                base = (day_penalty + self.trainer_load[trainer_id] * TRAINER_LOAD_PENALTY
+                        + (0 if trainer_id in session.preferred else NO_SPECIALTY_PENALTY))
+                if best is not None and base + smallest_waste * ROOM_WASTE_PENALTY >= best[0]:
+                    continue
+                for window_start, window_end in self.inputs.availability.get((trainer_id, day), ()):
+                    start = -(-window_start // self.grid) * self.grid
+                    while start + session.duration <= window_end:
+                        end = start + session.duration
+                        clash = self.busy.overlapping(("trainer", trainer_id, day), start, end)
+                        if clash:
+                            # jump past the trainer's conflicting class
+                            start = -(-max(e for _, e, _ in clash) // self.grid) * self.grid
+                            continue
+                        room = self._free_room(session, day, start, end)
+                        if room:
+                            score = base + (room[1] - session.request.min_capacity) * ROOM_WASTE_PENALTY + start / 10000
+                            if best is None or score < best[0]:
+                                best = (score, room[0], trainer_id, day, start)
+                            if room[1] - session.request.min_capacity == smallest_waste:
+                                break
+                        start += self.grid
+        return best
+
+    def _place(self, session, room_id, trainer_id, day, start):
+        placement = Placement(session, room_id, trainer_id, day, start)
+        self.busy.add(("room", room_id, day), placement.start, placement.end, placement)
+        self.busy.add(("trainer", trainer_id, day), placement.start, placement.end, placement)
+        self.trainer_load[trainer_id] += 1
+        self.class_days[session.class_id][day] += 1
+        session.placement = placement
+        return placement
+
+    def _unplace(self, placement):
+        self.busy.remove(("room", placement.room_id, placement.day), placement.start, placement)
+        self.busy.remove(("trainer", placement.trainer_id, placement.day), placement.start, placement)
+        self.trainer_load[placement.trainer_id] -= 1
+        self.class_days[placement.session.class_id][placement.day] -= 1
+        placement.session.placement = None
+
+    def _repair(self, session):
+        # Looks for a slot blocked by exactly one placed session, moves that session elsewhere and
+        # takes the slot. Existing schedules are never moved.
+        attempts = 0
+        for day in DAYS:
+            for trainer_id in session.trainers:
+                for window_start, window_end in self.inputs.availability.get((trainer_id, day), ()):
+                    start = -(-window_start // self.grid) * self.grid
+                    while start + session.duration <= window_end:
+                        end = start + session.duration
+                        for room_id, _ in session.rooms:
+                            # recomputed per room: a failed attempt puts the blocker back as a new placement
+                            blockers = {owner for _, _, owner in self.busy.overlapping(("trainer", trainer_id, day), start, end)}
+                            blockers |= {owner for _, _, owner in self.busy.overlapping(("room", room_id, day), start, end)}
+                            if len(blockers) != 1 or None in blockers:
+                                continue
+                            attempts += 1
+                            if attempts > self.repair_attempts:
+                                return False
+                            blocker = blockers.pop()
+                            self._unplace(blocker)
+                            placement = self._place(session, room_id, trainer_id, day, start)
+                            moved = self._best_slot(blocker.session)
+                            if moved:
+                                self._place(blocker.session, *moved[1:])
+                                return True
+                            self._unplace(placement)
+                            self._place(blocker.session, blocker.room_id, blocker.trainer_id, blocker.day, blocker.start)
+                        start += self.grid
+        return False
+
+    def solve(self, requests):
+        started = time.perf_counter()
+        unplaced = []
+        sessions = self._sessions(requests, unplaced)
+        leftover = []
+        for session in sessions:
+            slot = self._best_slot(session)
+            if slot:
+                self._place(session, *slot[1:])
+            else:
+                leftover.append(session)
+
+        repaired = 0
+        for session in leftover:
+            if self._repair(session):
+                repaired += 1
+            else:
+                unplaced.append((session.class_id, "no free room/trainer slot"))
+
+        placements = [session.placement for session in sessions if session.placement]
+        return TimetablePlan(placements, unplaced, round(time.perf_counter() - started, 3), repaired)
+
+
+def generate_timetable(db, requests, grid_minutes=15):
+    # Solves a plan on top of the current schedules; nothing is written until db.apply_timetable
+    inputs = db.get_timetable_inputs()
+    if isinstance(inputs, str):
+        return inputs
+    return TimetableSolver(inputs, grid_minutes).solve(requests)
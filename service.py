@@ -0,0 +1,514 @@
+# service.py
+# JSON/HTTP front end for the fitness club operations (python app.py --serve).
+#
+# Concurrency model: one asyncio event loop owns every client connection (HTTP/1.1 keep-alive),
+# so hundreds of mostly idle clients cost a socket each rather than a thread each. Endpoints
+# backed by AsyncDBManager interleave on the loop; the operations only DBManager offers run on a
+# bounded thread pool. Every request is limited by request_timeout (504 when exceeded) and idle
+# keep-alive connections are closed after idle_timeout.
+#
+# Authentication: /members/login, /trainers/login and /admin/login answer with a signed session
+# token (credentials.SessionTokens). Every other route except /health and member sign-up needs it
+# as "Authorization: Bearer <token>"; the member or trainer a request acts for is taken from the
+# token, never from the body or query, and each route lists the roles allowed to call it.
+import asyncio
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+from async_db_manager import AsyncDBManager
+from credentials import SessionTokens
+from db_manager import DBManager, load_db_config
+from queries import METRIC_BUCKETS, HealthMetricData
+
+REASONS = {200: "OK", 201: "Created", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+           404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable", 504: "Gateway Timeout"}
+MAX_BODY_BYTES = 1024 * 1024
+MEMBER, TRAINER, ADMIN = "member", "trainer", "admin"
+ANY_ROLE = (MEMBER, TRAINER, ADMIN)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, method, path, query, body, params, role=None, subject=None):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.body = body
+        self.params = params
+        # from the session token; None on public routes
+        self.role = role
+        self.subject = subject
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, "Body must be JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Body must be a JSON object")
+        return data
+
+    def field(self, data, name):
+        if name not in data:
+            raise HTTPError(400, f"Missing field: {name}")
+        return data[name]
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+
+def _to_json(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, HealthMetricData):
+        return {"weight": value.weight, "height": value.height, "bodyfat": value.bodyfat, "recorded_at": value.recorded_at}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _parse_time(value):
+    try:
+        return time.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"Invalid time: {value}")
+
+
+def _result(value, created=False):
+    # DBManager methods return an error string on failure
+    if isinstance(value, str):
+        raise HTTPError(409, value)
+    return (201 if created else 200), value
+
+
+def _rows(rows, *names):
+    if isinstance(rows, str):
+        raise HTTPError(500, rows)
+    return 200, [dict(zip(names, row)) for row in rows]
+
+
+class FitnessService:
+    def __init__(self, config=None, host="127.0.0.1", port=8080, request_timeout=10.0, idle_timeout=15.0,
+                 max_connections=1000, sync_workers=8):
+        self.config = config or load_db_config()
+        self.host = host
+        self.port = port
+        self.request_timeout = request_timeout
+        self.idle_timeout = idle_timeout
+        self.connection_slots = asyncio.Semaphore(max_connections)
+        self.sync_workers = sync_workers
+        self.db = None
+        self.sync_db = None
+        self.executor = None
+        self.tokens = SessionTokens(self.config["session_secret"], self.config["session_ttl_seconds"])
+        self.routes = []
+        self._register_routes()
+
+    # ROUTES ---------------------------------------------------------------------------------------
+    def route(self, method, pattern, handler, roles=()):
+        # roles that may call the route; an empty tuple makes it public
+        self.routes.append((method, re.compile(f"^{pattern}$"), handler, roles))
+
+    def _register_routes(self):
+        self.route("GET", "/health", self.health)
+        self.route("GET", "/stats/pool", self.pool_stats, (ADMIN,))
+        self.route("GET", "/stats/booking-queue", self.booking_queue_stats, (ADMIN,))
+
+        # the member routes act for the member in the token
+        self.route("POST", "/members", self.register_member)
+        self.route("POST", "/members/login", self.member_login)
+        self.route("GET", "/members/search", self.search_members, (TRAINER, ADMIN))
+        self.route("GET", "/members/me/profile", self.member_profile, (MEMBER,))
+        self.route("GET", "/members/me/bookings", self.member_bookings, (MEMBER,))
+        self.route("POST", "/members/me/health-metrics", self.add_health_metrics, (MEMBER,))
+        self.route("GET", "/members/me/health-metrics/series", self.metric_series, (MEMBER,))
+        self.route("GET", "/classes/available", self.available_classes, ANY_ROLE)
+        self.route("POST", "/bookings", self.book_class, (MEMBER,))
+        self.route("POST", "/bookings/batch", self.book_many, (ADMIN,))
+        self.route("DELETE", r"/bookings/(?P<booking_id>\d+)", self.cancel_booking, (MEMBER,))
+        self.route("POST", "/booking-requests", self.request_booking, (MEMBER,))
+        self.route("GET", r"/booking-requests/(?P<request_id>\d+)", self.booking_request, (MEMBER,))
+        self.route("DELETE", r"/booking-requests/(?P<request_id>\d+)", self.cancel_booking_request, (MEMBER,))
+
+        # the trainer routes act for the trainer in the token
+        self.route("POST", "/trainers", self.register_trainer, (ADMIN,))
+        self.route("POST", "/trainers/login", self.trainer_login)
+        self.route("GET", "/trainers/me/schedule", self.trainer_schedule, (TRAINER,))
+        self.route("GET", "/trainers/me/availability", self.trainer_availability, (TRAINER,))
+        self.route("POST", "/trainers/me/availability", self.add_trainer_availability, (TRAINER,))
+
+        self.route("POST", "/admin/login", self.admin_login)
+        self.route("GET", "/rooms", self.all_rooms, ANY_ROLE)
+        self.route("POST", "/rooms", self.add_room, (ADMIN,))
+        self.route("DELETE", r"/rooms/(?P<room_id>\d+)", self.remove_room, (ADMIN,))
+        self.route("GET", "/classes", self.all_classes, ANY_ROLE)
+        self.route("POST", "/classes", self.add_class, (ADMIN,))
+        self.route("DELETE", r"/classes/(?P<class_id>\d+)", self.remove_class, (ADMIN,))
+        self.route("GET", "/schedules", self.all_schedules, ANY_ROLE)
+        self.route("POST", "/schedules", self.add_schedule, (ADMIN,))
+        self.route("DELETE", r"/schedules/(?P<schedule_id>\d+)", self.remove_schedule, (ADMIN,))
+
+    def authenticate(self, headers, roles):
+        # (role, subject) from the bearer token, which must carry one of roles
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        session = self.tokens.verify(token.strip()) if scheme.lower() == "bearer" else None
+        if session is None:
+            raise HTTPError(401, "Missing or invalid session token")
+        if session[0] not in roles:
+            raise HTTPError(403, "Not allowed for this account")
+        return session
+
+    async def run_sync(self, method, *args):
+        # DBManager calls block, so they run on the bounded worker pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(method, *args))
+
+    # SERVER ---------------------------------------------------------------------------------------
+    async def start(self):
+        self.db = AsyncDBManager(self.config)
+        self.sync_db = DBManager(self.config)
+        schema = self.sync_db.ensure_schema()
+        if isinstance(schema, str):
+            raise RuntimeError(f"Database schema check failed: {schema}")
+        self.executor = ThreadPoolExecutor(max_workers=self.sync_workers, thread_name_prefix="service-sync")
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=1024)
+        print(f"Serving on http://{self.host}:{self.port}")
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.db.close()
+        self.executor.shutdown(wait=False)
+        self.sync_db.close()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def handle_connection(self, reader, writer):
+        if self.connection_slots.locked():
+            await self._write_response(writer, 503, {"error": "Too many connections"}, keep_alive=False)
+            writer.close()
+            return
+        async with self.connection_slots:
+            try:
+                while True:
+                    keep_alive = await self._handle_request(reader, writer)
+                    if not keep_alive:
+                        break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                writer.close()
+
+    async def _handle_request(self, reader, writer):
+        # Returns whether the connection should be kept open for another request
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return False
+
+        try:
+            lines = head.decode("latin-1").split("\r\n")
+            method, target, version = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+        except ValueError:
+            await self._write_response(writer, 400, {"error": "Malformed request"}, keep_alive=False)
+            return False
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+        length = headers.get("content-length", "0").strip() or "0"
+        if not length.isdigit():
+            await self._write_response(writer, 400, {"error": "Invalid Content-Length"}, keep_alive=False)
+            return False
+        length = int(length)
+        if length > MAX_BODY_BYTES:
+            await self._write_response(writer, 413, {"error": "Body too large"}, keep_alive=False)
+            return False
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), self.request_timeout) if length else b""
+        except asyncio.TimeoutError:
+            return False
+
+        try:
+            status, payload = await asyncio.wait_for(self.dispatch(method, target, body, headers), self.request_timeout)
+        except asyncio.TimeoutError:
+            status, payload = 504, {"error": "Request timed out"}
+        await self._write_response(writer, status, payload, keep_alive)
+        return keep_alive
+
+    async def dispatch(self, method, target, body, headers):
+        url = urlsplit(target)
+        allowed = False
+        for route_method, pattern, handler, roles in self.routes:
+            match = pattern.match(url.path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            try:
+                role, subject = self.authenticate(headers, roles) if roles else (None, None)
+                request = Request(method, url.path, parse_qs(url.query), body, match.groupdict(), role, subject)
+                return await handler(request)
+            except HTTPError as e:
+                return e.status, {"error": e.message}
+            except Exception as e:
+                return 500, {"error": str(e)}
+        if allowed:
+            return 405, {"error": "Method not allowed"}
+        return 404, {"error": "Not found"}
+
+    async def _write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=_to_json).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if keep_alive:
+            head += f"Keep-Alive: timeout={int(self.idle_timeout)}\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+    # GENERAL --------------------------------------------------------------------------------------
+    async def health(self, request):
+        return 200, {"status": "ok"}
+
+    async def pool_stats(self, request):
+        return 200, {"async": self.db.get_pool_stats(), "sync": self.sync_db.get_pool_stats()}
+
+    async def booking_queue_stats(self, request):
+        # workers running in this process; workers started with booking_queue.py report on their own
+        workers = self.sync_db.booking_workers
+        return 200, {"enabled": self.config["booking_queue"], "workers": workers.stats() if workers else None}
+
+    # MEMBER ---------------------------------------------------------------------------------------
+    async def register_member(self, request):
+        data = request.json()
+        result = await self.run_sync(
+            self.sync_db.register_member,
+            request.field(data, "first_name"), request.field(data, "last_name"), request.field(data, "email"),
+            request.field(data, "password"), data.get("date_of_birth"), data.get("gender"), data.get("fitness_goals")
+        )
+        return _result({"member_id": result} if isinstance(result, int) else result, created=True)
+
+    async def member_login(self, request):
+        data = request.json()
+        member_id = await self.db.member_login(request.field(data, "email"), request.field(data, "password"))
+        if not member_id:
+            raise HTTPError(401, "Invalid credentials")
+        return 200, {"member_id": member_id, "token": self.tokens.issue(MEMBER, member_id)}
+
+    async def search_members(self, request):
+        try:
+            limit = int(request.arg("limit", 10))
+            offset = int(request.arg("offset", 0))
+        except ValueError:
+            raise HTTPError(400, "limit and offset must be numbers")
+        rows = await self.db.search_members(request.arg("q", ""), min(limit, 100), offset)
+        return _rows(rows, "member_id", "first_name", "last_name", "email", "fitness_goals", "health_metric", "score")
+
+    async def member_profile(self, request):
+        profile = await self.db.get_member_profile(request.subject)
+        if not profile:
+            raise HTTPError(404, "Profile not found")
+        return 200, {"member_id": profile[0], "first_name": profile[1], "last_name": profile[2],
+                     "email": profile[3], "fitness_goals": profile[5], "health_metric": profile[6],
+                     "total_bookings": profile[7], "metric_count": profile[8]}
+
+    async def member_bookings(self, request):
+        rows = await self.db.get_member_bookings(request.subject)
+        return _rows(rows, "booking_id", "class_name", "date", "start_time", "end_time")
+
+    async def add_health_metrics(self, request):
+        data = request.json()
+        metrics = {key: data.get(key) for key in ("weight", "height", "bodyfat")}
+        return _result(await self.run_sync(self.sync_db.add_health_metrics, int(request.subject), metrics),
+                       created=True)
+
+    async def metric_series(self, request):
+        bucket = request.arg("bucket", "week")
+        if bucket not in METRIC_BUCKETS:
+            raise HTTPError(400, f"bucket must be one of {', '.join(METRIC_BUCKETS)}")
+        try:
+            start = datetime.fromisoformat(request.arg("start")) if request.arg("start") else None
+            end = datetime.fromisoformat(request.arg("end")) if request.arg("end") else None
+        except ValueError:
+            raise HTTPError(400, "start and end must be ISO dates")
+        rows = await self.db.get_metric_series(request.subject, bucket, start, end)
+        return _rows(rows, "period", "samples", "weight_avg", "weight_min", "weight_max", "height_avg",
+                     "bodyfat_avg", "bodyfat_min", "bodyfat_max")
+
+    async def available_classes(self, request):
+        try:
+            limit = int(request.arg("limit", 50))
+            offset = int(request.arg("offset", 0))
+        except ValueError:
+            raise HTTPError(400, "limit and offset must be numbers")
+        try:
+            start = date.fromisoformat(request.arg("start")) if request.arg("start") else None
+            end = date.fromisoformat(request.arg("end")) if request.arg("end") else None
+        except ValueError:
+            raise HTTPError(400, "start and end must be ISO dates")
+        rows = await self.db.get_available_classes(
+            request.arg("day_of_week"), request.arg("class_name"),
+            request.arg("only_available", "false").lower() == "true", min(limit, 200), offset, start, end
+        )
+        return _rows(rows, "occurrence_id", "date", "class_name", "room_name", "start_time", "end_time",
+                     "bookings", "available_spots")
+
+    async def book_class(self, request):
+        data = request.json()
+        return _result(await self.db.book_class(request.subject, request.field(data, "occurrence_id")), created=True)
+
+    async def request_booking(self, request):
+        # queued booking: answers 202 at once, the outcome is polled at /booking-requests/{id}
+        data = request.json()
+        result = await self.db.request_booking(request.subject, request.field(data, "occurrence_id"))
+        if isinstance(result, str):
+            raise HTTPError(409, result)
+        return 202, {"request_id": result, "status": "pending"}
+
+    async def booking_request(self, request):
+        row = await self.db.get_booking_request(request.params["request_id"], request.subject)
+        if row == "Request not found":
+            raise HTTPError(404, row)
+        if isinstance(row, str):
+            raise HTTPError(500, row)
+        return 200, dict(zip(("request_id", "occurrence_id", "status", "booking_id", "waitlist_position"), row))
+
+    async def cancel_booking_request(self, request):
+        result = await self.db.cancel_booking_request(request.params["request_id"], request.subject)
+        if result == "Request not found or already decided":
+            raise HTTPError(404, result)
+        return _result(result)
+
+    async def book_many(self, request):
+        data = request.json()
+        pairs = request.field(data, "pairs")
+        results = await self.run_sync(self.sync_db.book_many, pairs)
+        return _result(results)
+
+    async def cancel_booking(self, request):
+        result = await self.db.cancel_booking(request.params["booking_id"], request.subject)
+        if result == "Booking not found":
+            raise HTTPError(404, result)
+        return _result(result)
+
+    # TRAINER --------------------------------------------------------------------------------------
+    async def register_trainer(self, request):
+        data = request.json()
+        result = await self.run_sync(
+            self.sync_db.register_trainer,
+            request.field(data, "first_name"), request.field(data, "last_name"), request.field(data, "email"),
+            request.field(data, "password"), data.get("specialization")
+        )
+        return _result({"trainer_id": result} if isinstance(result, int) else result, created=True)
+
+    async def trainer_login(self, request):
+        data = request.json()
+        trainer_id = await self.db.trainer_login(request.field(data, "email"), request.field(data, "password"))
+        if not trainer_id:
+            raise HTTPError(401, "Invalid credentials")
+        return 200, {"trainer_id": trainer_id, "token": self.tokens.issue(TRAINER, trainer_id)}
+
+    async def trainer_schedule(self, request):
+        rows = await self.db.get_trainer_schedule(request.subject)
+        return _rows(rows, "class_name", "room_name", "start_time", "end_time")
+
+    async def trainer_availability(self, request):
+        rows = await self.run_sync(self.sync_db.get_trainer_availability, int(request.subject))
+        return _rows(rows, "availability_id", "day_of_week", "start_time", "end_time")
+
+    async def add_trainer_availability(self, request):
+        data = request.json()
+        return _result(await self.run_sync(
+            self.sync_db.add_trainer_availability, int(request.subject),
+            request.field(data, "day_of_week"), _parse_time(request.field(data, "start_time")),
+            _parse_time(request.field(data, "end_time"))
+        ), created=True)
+
+    # ADMIN ----------------------------------------------------------------------------------------
+    async def admin_login(self, request):
+        data = request.json()
+        username = request.field(data, "username")
+        if not await self.db.admin_login(username, request.field(data, "password")):
+            raise HTTPError(401, "Invalid credentials")
+        return 200, {"admin": True, "token": self.tokens.issue(ADMIN, username)}
+
+    async def all_rooms(self, request):
+        return _rows(await self.db.get_all_rooms(), "room_id", "room_name", "capacity")
+
+    async def add_room(self, request):
+        data = request.json()
+        result = await self.db.add_room(request.field(data, "room_name"), request.field(data, "capacity"))
+        return _result({"room_id": result} if isinstance(result, int) else result, created=True)
+
+    async def remove_room(self, request):
+        return _result(await self.db.remove_room(request.params["room_id"]))
+
+    async def all_classes(self, request):
+        return _rows(await self.db.get_all_classes(), "class_id", "name", "description", "duration")
+
+    async def add_class(self, request):
+        data = request.json()
+        result = await self.db.add_class(request.field(data, "name"), data.get("description"),
+                                         request.field(data, "duration"))
+        return _result({"class_id": result} if isinstance(result, int) else result, created=True)
+
+    async def remove_class(self, request):
+        return _result(await self.db.remove_class(request.params["class_id"]))
+
+    async def all_schedules(self, request):
+        return _rows(await self.db.get_all_schedules(), "schedule_id", "class_name", "room_name", "trainer",
+                     "start_time", "end_time")
+
+    async def add_schedule(self, request):
+        data = request.json()
+        result = await self.db.add_schedule(
+            request.field(data, "class_id"), request.field(data, "room_id"), request.field(data, "trainer_id"),
+            request.field(data, "day_of_week"), _parse_time(request.field(data, "start_time")),
+            _parse_time(request.field(data, "end_time"))
+        )
+        return _result({"schedule_id": result} if isinstance(result, int) else result, created=True)
+
+    async def remove_schedule(self, request):
+        return _result(await self.db.remove_schedule(request.params["schedule_id"]))
+
+
+def run_service(host="127.0.0.1", port=8080, request_timeout=10.0, idle_timeout=15.0, max_connections=1000,
+                sync_workers=8, config=None):
+    service = FitnessService(config, host, port, request_timeout, idle_timeout, max_connections, sync_workers)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        print("Service stopped")